@@ -1,19 +1,93 @@
-import matplotlib.pyplot as plt, numpy as np
+import numpy as np
 
-def find_b(C_vals):
-    b = [1, 0, 1, 0]
+TOL = 1e-9 # Largest relative change of any Cin to count as converged
+MAX_ITER = 1000
+ACCEL_DEPTH = 3 # Past steps mixed into each accelerated step
+
+# Path is described as data, one entry per stage from path input to output
+    # g: logical effort of each stage
+    # side: other stages whose input each stage output also drives, besides
+        # next stage (feedback and branches)
+    # side_c: fixed off-path load on each stage output (optional)
+    # p: parasitic delay of each stage (optional, 0 if not given)
+    # cout: load on path output, cin: input capacitance of path
+# Starting C_in guesses of each JK path stage
+CIN_START = [8, 5, 4, 5]
+
+JK_PATH = {'name': 'JK flip-flop',
+            'g': [5/3, 1.4367, 4/3, 1.4367],
+            'side': [[], [1], [], [0, 3]],
+            'cout': 90,
+            'cin': 3}
+
+def path_arrays(paths):
+    """
+        Function to turn path description (or list of descriptions with
+            same number of stages) into arrays used for sizing. Lists are
+            stacked with one path per row. Arrays already made are passed
+            through
+            
+        OUTPUT
+        :arrays: - dict with 'g', 'p', 'side_c' (..., N), 'side' (..., N, N)
+            where side[i, k] is 1 if stage i output drives stage k input,
+            and 'cout', 'cin' (...)
+    """
+    if isinstance(paths, dict) and 'S' in paths:
+        return paths
+    if isinstance(paths, dict):
+        N = len(paths['g'])
+        S = np.zeros((N, N))
+        for i, stages in enumerate(paths.get('side', [[]]*N)):
+            for k in stages:
+                S[i, k] += 1
+        return {'g': np.asarray(paths['g'], dtype=float), 'S': S,
+                'side_c': np.asarray(paths.get('side_c', np.zeros(N)), dtype=float),
+                'p': np.asarray(paths.get('p', np.zeros(N)), dtype=float),
+                'cout': np.asarray(paths['cout'], dtype=float),
+                'cin': np.asarray(paths['cin'], dtype=float)}
+        
+    arrays = [path_arrays(path) for path in paths]
+    
+    return {k: np.stack([a[k] for a in arrays]) for k in arrays[0]}
+    
+# Number of dimensions of each path array for a single path
+_PATH_NDIM = {'S': 2, 'cout': 0, 'cin': 0}
+
+def _path_rows(P):
+    # Number of paths stacked in path arrays, 1 for a single path
+    return P['g'].shape[0] if P['g'].ndim > 1 else 1
     
-    b[1] = (C_vals[2]+C_vals[1])/C_vals[2]
-    b[3] = (C_vals[0]+C_vals[3]+90)/90
+def _stage_loads(C, i, P):
+    # On-path and off-path load on output of stage i
+    if i == C.shape[-1] - 1:
+        on = P['cout']*np.ones(C.shape[:-1])
+    else:
+        on = C[..., i+1]
+    off = np.sum(C*P['S'][..., i, :], axis=-1) + P['side_c'][..., i]
     
-    return b, np.prod(b)
+    return on, off
     
-def get_params(C_vals, NUM_STAGES, g_vals):
-    G = np.prod(g_vals)
-    H = 90/3
-    b, B = find_b(C_vals)
+def find_b(C_vals, path=JK_PATH):
+    # C_vals can be one set of Cin values or array with one set per row
+    C = np.asarray(C_vals, dtype=float)
+    P = path_arrays(path)
+    b = []
+    for i in range(C.shape[-1]):
+        on, off = _stage_loads(C, i, P)
+        b.append((on+off)/on)
+    b = np.stack(b, axis=-1)
+    
+    return b, np.prod(b, axis=-1)
+    
+def get_params(C_vals, g_vals=None, path=JK_PATH):
+    P = path_arrays(path)
+    if g_vals is None:
+        g_vals = P['g']
+    G = np.prod(g_vals, axis=-1)
+    H = P['cout']/P['cin']
+    b, B = find_b(C_vals, P)
     F = G*B*H
-    f = F**(1/NUM_STAGES)
+    f = F**(1/np.shape(C_vals)[-1])
     
     return G, H, B, F, b, f
     
@@ -24,28 +98,183 @@ def round_list(l):
         
     return l
     
+def sizing_step(C_vals, g_vals, f, path=JK_PATH):
+    """
+        Function to do one pass of Cin updates. Stages are sized as g*Cload/f
+            working back from last stage, using Cin values already updated
+            in this pass for the load. Works on one set of values or on
+            arrays with one set per row
+    """
+    P = path_arrays(path)
+    C = np.array(C_vals, dtype=float)
+    g = np.broadcast_to(np.asarray(g_vals, dtype=float), C.shape)
+    f = np.asarray(f)
+    
+    for i in reversed(range(C.shape[-1])):
+        on, off = _stage_loads(C, i, P)
+        C[..., i] = g[..., i]*(on+off)/f
+    
+    return C
+    
+def _step(C, g, P):
+    # One fixed-point step, f from current Cin values
+    f = get_params(C, g, P)[-1]
+    
+    return sizing_step(C, g, f, P)
+    
+def path_delay(C_vals, g_vals=None, path=JK_PATH):
+    """
+        Function to get delay of path in units of tau, as sum of stage
+            efforts g*Cload/Cin of given sizing plus parasitic delays
+    """
+    P = path_arrays(path)
+    if g_vals is None:
+        g_vals = P['g']
+    C = np.asarray(C_vals, dtype=float)
+    g = np.broadcast_to(np.asarray(g_vals, dtype=float), C.shape)
+    D = np.sum(P['p'], axis=-1)
+    for i in range(C.shape[-1]):
+        on, off = _stage_loads(C, i, P)
+        D = D + g[..., i]*(on+off)/C[..., i]
+        
+    return D
+    
+def _anderson(steps, changes):
+    # Mix of last steps whose changes cancel best in least squares sense,
+        # rows with no earlier steps or no usable mix keep last step
+    new = steps[-1]
+    if len(steps) < 2:
+        return new
+    dF = np.stack([b - a for a, b in zip(changes, changes[1:])], axis=-1)
+    dX = np.stack([b - a for a, b in zip(steps, steps[1:])], axis=-1)
+    A = np.einsum('nij,nik->njk', dF, dF)
+    # Small ridge keeps A solvable once changes are tiny or repeated
+    A = A + (1e-12*np.trace(A, axis1=1, axis2=2) + 1e-300)[:, None, None] * \
+            np.eye(A.shape[-1])
+    with np.errstate(all='ignore'):
+        gamma = np.linalg.solve(A, np.einsum('nij,ni->nj', dF, changes[-1])[..., None])
+        mix = new - np.einsum('nij,nj->ni', dX, gamma[..., 0])
+    ok = np.all(np.isfinite(mix) & (mix > 0), axis=-1)
+    
+    return np.where(ok[:, None], mix, new)
+    
+def solve_sizing(CIN, g_vals=None, path=JK_PATH, tol=TOL, max_iter=MAX_ITER,
+                    accelerate=False, history=False):
+    """
+        Function to iterate Cin values to convergence for many starting
+            guesses and g value sets at once. Rows are broadcast against each
+            other and each row stops being updated once no Cin changes by
+            more than :tol: of its value
+            
+        INPUTS
+        :CIN: - starting Cin values, shape (NUM_STAGES,) or (n, NUM_STAGES)
+        :g_vals: - logical efforts, shape (NUM_STAGES,) or (n, NUM_STAGES),
+            taken from path if not given
+        :path: - path description, list of them or path_arrays output with
+            one path per row
+        :tol: - relative change counted as converged
+        :max_iter: - most iterations done for any row
+        :accelerate: - bool of whether to use Anderson mixing, each iteration
+            still takes one step but next Cin values are the mix of the last
+            ACCEL_DEPTH+1 steps that best cancels their changes. Rows where
+            the mix is not finite and positive keep the plain step
+        :history: - bool of whether to also return Cin values after every
+            iteration
+            
+        OUTPUTS
+        :CIN: - np.array (n, NUM_STAGES) of final Cin values
+        :iters: - np.array of iterations (sizing steps) done for each row
+        :converged: - bool np.array of which rows converged
+        :hist: - list of (n, NUM_STAGES) np.arrays, starting guess first.
+            Only returned if :history: is set
+    """
+    P = path_arrays(path)
+    if g_vals is None:
+        g_vals = P['g']
+    # Every design point gets its own row of Cin, g and path arrays so rows
+        # can be dropped as they converge
+    n = max(np.atleast_2d(CIN).shape[0], np.atleast_2d(g_vals).shape[0],
+            _path_rows(P))
+    C = np.array(np.broadcast_to(CIN, (n, np.shape(CIN)[-1])), dtype=float)
+    g = np.broadcast_to(np.asarray(g_vals, dtype=float), C.shape)
+    P = {k: np.broadcast_to(v, (n,) + v.shape[v.ndim - _PATH_NDIM.get(k, 1):])
+            for k, v in P.items()}
+    iters = np.zeros(C.shape[0], dtype=int)
+    converged = np.zeros(C.shape[0], dtype=bool)
+    active = np.arange(C.shape[0])
+    hist = [C.copy()]
+    steps, changes = [], [] # Last steps and changes of active rows
+    
+    for i in range(max_iter):
+        if not len(active):
+            break
+        c, ga = C[active], g[active]
+        Pa = {k: v[active] for k, v in P.items()}
+        new = _step(c, ga, Pa)
+        change = new - c
+        done = np.all(np.abs(change) <= tol*np.abs(new), axis=-1)
+        if accelerate:
+            steps = (steps + [new])[-(ACCEL_DEPTH+1):]
+            changes = (changes + [change])[-(ACCEL_DEPTH+1):]
+            new = np.where(done[:, None], new, _anderson(steps, changes))
+            steps = [s[~done] for s in steps]
+            changes = [d[~done] for d in changes]
+            
+        C[active] = new
+        iters[active] += 1
+        converged[active[done]] = True
+        active = active[~done]
+        if history:
+            hist.append(C.copy())
+            
+    if history:
+        return C, iters, converged, hist
+    
+    return C, iters, converged
+    
+def evaluate_paths(paths, tol=TOL, max_iter=MAX_ITER, accelerate=False):
+    """
+        Function to size many candidate paths and rank them by delay. Paths
+            with same number of stages are stacked and solved together.
+            Starting guess grows geometrically from path cin to cout
+            
+        INPUTS
+        :paths: - list of path descriptions, see JK_PATH
+        :tol, max_iter, accelerate: - passed on to solve_sizing
+        
+        OUTPUT
+        :results: - list of dicts with 'index' of path in :paths:, 'name',
+            'D' (delay in tau), 'F', 'f', 'B', 'cin' (np.array of sized
+            Cin values) and 'converged', fastest path first
+    """
+    results = []
+    lengths = np.array([len(path['g']) for path in paths])
+    for N in np.unique(lengths):
+        index = np.flatnonzero(lengths == N)
+        P = path_arrays([paths[i] for i in index])
+        guess = P['cin'][:, None]*(P['cout']/P['cin'])[:, None]**(np.arange(N)/N)
+        C, iters, converged = solve_sizing(guess, path=P, tol=tol,
+                                            max_iter=max_iter, accelerate=accelerate)
+        G, H, B, F, b, f = get_params(C, path=P)
+        D = path_delay(C, path=P)
+        for j, i in enumerate(index):
+            results.append({'index': int(i), 'name': paths[i].get('name', str(i)),
+                            'D': D[j], 'F': F[j], 'f': f[j], 'B': B[j],
+                            'cin': C[j], 'converged': bool(converged[j])})
+            
+    return sorted(results, key=lambda r: r['D'])
+    
 if __name__ == '__main__':
-    NUM_ITER = 10
+    import matplotlib.pyplot as plt
+    
     NUM_STAGES = 4
-    ALL_CIN = np.zeros((NUM_ITER, NUM_STAGES))
-    CIN = [8, 5, 4, 5]
+    CIN = CIN_START
     g_vals = [5/3, 1.4367, 4/3, 1.4367]
     
-    G, H, B, F, b, f = get_params(CIN, NUM_STAGES, g_vals)
-    
-    for i in range(NUM_ITER):
-        for j in range(NUM_STAGES):
-            if j == 0:
-                cin = 90+CIN[-(j+1)]+CIN[j]
-            elif j == 2:
-                cin = CIN[-j] + CIN[-(j+1)]
-            else:
-                cin = CIN[-j]
-                
-            g = g_vals[-(j+1)]
-                
-            CIN[-(j+1)] = g*(cin/f)
-            
+    CIN, iters, converged, hist = solve_sizing(CIN, g_vals, history=True)
+    ALL_CIN = np.array(hist)[1:, 0]
+    for i in range(iters[0]):
+        G, H, B, F, b, f = get_params(hist[i][0], g_vals)
         print('ITERATION %s: ' % (i+1), 
                 'G=',G, 
                 'H=',H, 
@@ -53,12 +282,13 @@ if __name__ == '__main__':
                 'F=',F, 
                 'b=',b, 
                 'f=',f)
-        G, H, B, F, b, f = get_params(CIN, NUM_STAGES, g_vals)
-        ALL_CIN[i] = np.array(CIN)
+    G, H, B, F, b, f = get_params(CIN[0], g_vals)
+    print('\n%s after %s iterations' % ('CONVERGED' if converged[0] else
+                                        'NOT CONVERGED', iters[0]))
         
     print('C_in VALUES BY ITERATION:\n', ALL_CIN)
     l = ['STAGE %s' % (i+1) for i in range(NUM_STAGES)]
-    CIN = np.array(round_list(CIN))
+    CIN = np.array(round_list(list(CIN[0])))
     PMOS = [CIN[0]*(2/5), CIN[1]*(2/5),
             CIN[2]*(2/4), CIN[3]*(2/5)]
     print('\nPMOS K RATIO: \n', PMOS)
@@ -1,10 +1,41 @@
-import pandas as pd, numpy as np
-import matplotlib.pyplot as plt
-import os
+import numpy as np
+import os, sys
 
+# CSV cache is shared with Lab 3 analysis scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 
+                                os.pardir, 'Lab3'))
+import lab3_cache as lc
+import lab3_processing as lp
+import lab3_decimate as ld
+import lab3_resample as lr
+import lab3_profile as lpf
+import lab3_lazy as ll
+
+# Only imported once they are used, so headless runs start quickly
+pd = ll.lazy_import('pandas')
+plt = ll.lazy_import('matplotlib.pyplot')
+
+TIME_COL = 'time (s)'
+CLK_COL = 'CLK (V)'
 HALF_TRIGGER = 0.5
+HYSTERESIS = 0.05 # Debounce 50% crossings with +/-5% band
+# 50% crossings closer together than this (s) are glitches, the 10 samples
+    # glitches were once counted in at the 100 fs step of simulator runs
+MIN_DWELL = 1e-12
 DATA_DIR = 'data'
 PLOT_DIR = 'plots'
+PS = 1e-12 # Delays are reported in ps
+SAMPLE_DT = None # Step (s) runs are resampled to, same number of points if None
+JK_COLS = {'clk': CLK_COL, 'j': 'J (V)', 'k': 'K (V)', 'q': 'Q (V)', 'qb': 'QB (V)'}
+
+# Logic level change of a trace, time of its 50% crossing, new level and
+    # slope of trace at crossing (V/s)
+EVENT_DTYPE = np.dtype([('time', np.float64), ('level', np.int8), ('slew', np.float32)])
+
+# Clicked delay points and plot background saved for blitting them
+delayPoints = {'p': [], 'x': []}
+background = None
+
 if not os.path.exists(PLOT_DIR):
     os.mkdir(PLOT_DIR)
 
@@ -12,7 +43,8 @@ def load_data(filename, exclude=[], print_cols=False):
     # Function to read CSV data into pandas dataframe and drop any specified
         #columns
         
-    df = pd.read_csv(filename)
+    # Columns are parsed once then opened from binary cache on later runs
+    df = lc.read_csv_cached(filename)
     print('\nFile found!')
     if print_cols:
         print('Columns:', list(df))
@@ -36,20 +68,23 @@ def get_files(f_dir, print_nums=True):
             index in file directory. If incorrect index is input,
             function acts recursively to ask for new correct input
     """
+    # CSV cache folder is kept in data directory, leave it out of choices
+    files = [f for f in os.listdir(f_dir) if not f.startswith('.')]
+    
     # If data directory files are to be output, output them with 
         # associated index numbers
-    if len(os.listdir(f_dir)) == 1:
+    if len(files) == 1:
         print('Loading only file found in directory...')
-        return os.path.join(f_dir, os.listdir(f_dir)[0])
+        return os.path.join(f_dir, files[0])
     if print_nums:
-        for i, f in enumerate(os.listdir(f_dir)):
+        for i, f in enumerate(files):
             print('%s: %s' % (i, f))
         
     # Get user input for index
     num = input('Enter number of file to select: ')
     try:
         # If index is valid, return joined path of data directory and filename
-        f = os.listdir(f_dir)[int(num)]
+        f = files[int(num)]
         return os.path.join(f_dir, f)
     except:
         # If index is not valid, notify user and re-run function. No join
@@ -60,21 +95,316 @@ def get_files(f_dir, print_nums=True):
         f = get_files(f_dir, print_nums=False)
         return f
     
+def high_level(points):
+    """
+        Function to get logic high level of trace, median of samples in top
+            half of its range. Unlike max of trace this is not pulled up by
+            noise, so 50% level is not moved
+    """
+    points = np.asarray(points, dtype=float)
+    points = points[~np.isnan(points)]
+    if not len(points):
+        return np.nan
+    lo, hi = np.percentile(points, [1, 99])
+
+    return np.median(points[points >= (lo + hi) / 2])
+    
+def half_crossings(points, raw_max, time):
+    """
+        Function to get sorted np.array of sample indicies of debounced 50%
+            crossings, with noisy multiple crossings within MIN_DWELL seconds
+            removed. Dwell is measured against :time:, so it is the same
+            time window along traces with uneven steps
+    """
+    band_levels = lp.hysteresis_levels([raw_max * HALF_TRIGGER], raw_max * HYSTERESIS)
+    inds, ts = lp.find_crossings(points, band_levels, np.asarray(time, dtype=float))
+    inds, ts = lp.debounce_crossings(inds, ts, band_levels, points[0], MIN_DWELL)
+    
+    return np.sort(np.asarray(inds[0]))
+    
+def edge_times(points, time, raw_max=None):
+    """
+        Function to get times of debounced 50% crossings of trace, split into
+            rising and falling edges
+
+        INPUTS
+        :points: - np.array of y-points for trace
+        :time: - np.array of times for each point
+        :raw_max: - high level of trace, high_level of points if not given
+
+        OUTPUTS
+        :rise_ts: - sorted np.array of rising edge times
+        :fall_ts: - sorted np.array of falling edge times
+    """
+    points = np.asarray(points)
+    if raw_max is None:
+        raw_max = high_level(points)
+    inds = half_crossings(points, raw_max, time)
+    ts = lp.interp_crossings(points, np.asarray(time), inds, raw_max * HALF_TRIGGER)
+    rising = points[inds + 1] > points[inds]
+
+    return ts[rising], ts[~rising]
+
+def clk_q_delays(df, clk_col=CLK_COL, out_cols=None, clk_edge='rise'):
+    """
+        Function to get clock to output delay of every output transition in
+            simulation without clicking on plots. Each output edge is paired
+            with latest active clock edge before it
+
+        INPUTS
+        :df: - pd.DataFrame of simulation with TIME_COL, clock and outputs
+        :clk_col: - clock column name
+        :out_cols: - list of output column names, columns starting with Q
+            (such as 'Q (V)' and 'QB (V)') if not given
+        :clk_edge: - 'rise' or 'fall' for which clock edge triggers outputs
+
+        OUTPUT
+        :delays: - pd.DataFrame with 'output', 'edge' ('rise' or 'fall' of
+            output) and 'delay' (s) columns, one row per output transition
+    """
+    time = df[TIME_COL].values
+    clk_rise, clk_fall = edge_times(df[clk_col].values, time)
+    clk_ts = clk_rise if clk_edge == 'rise' else clk_fall
+    if out_cols is None:
+        out_cols = [c for c in df if str(c).upper().startswith('Q')]
+
+    delays = []
+    for col in out_cols:
+        for edge, out_ts in zip(('rise', 'fall'), edge_times(df[col].values, time)):
+            d = lp.match_edges(out_ts, clk_ts)
+            delays.append(pd.DataFrame({'output': col, 'edge': edge, 'delay': d}))
+
+    return pd.concat(delays, ignore_index=True) if delays else \
+            pd.DataFrame({'output': [], 'edge': [], 'delay': []})
+
+def clk_q_dir(data_dir=DATA_DIR, ext='.csv', cached=True, **kwargs):
+    """
+        Function to get clock to output delays of every simulation CSV in
+            directory with clk_q_delays, kwargs are passed on to it. With
+            :cached: delays of files whose contents and delay settings are
+            unchanged since last run are read back instead of found again
+
+        OUTPUT
+        :delays: - pd.DataFrame of all delays with 'file' column added
+    """
+    # High level is named so delays cached from max of trace are not reused
+    params = dict(kwargs, half_trigger=HALF_TRIGGER, hysteresis=HYSTERESIS,
+                    min_dwell=MIN_DWELL, high_level='median')
+    delays = []
+    for f in sorted(os.listdir(data_dir)):
+        if f.lower().endswith(ext):
+            path = os.path.join(data_dir, f)
+            result = lc.result_file(path, params, ext='.csv') if cached else None
+            if result and os.path.exists(result):
+                d = pd.read_csv(result, dtype={'output': str, 'edge': str},
+                                float_precision='round_trip')
+            else:
+                d = clk_q_delays(lc.read_csv_cached(path), **kwargs)
+                if result:
+                    d.to_csv(result, index=False)
+            d.insert(0, 'file', f)
+            delays.append(d)
+    if not delays:
+        return pd.DataFrame({'file': [], 'output': [], 'edge': [], 'delay': []})
+
+    return pd.concat(delays, ignore_index=True)
+
+def delay_summary(delays, unit=PS):
+    """
+        Function to get distribution of delays for each file, output and edge
+            in units of :unit: seconds (ps by default)
+    """
+    scaled = delays.assign(delay=delays['delay'] / unit)
+
+    return scaled.groupby(['file', 'output', 'edge'])['delay'].describe()
+    
+def digitize(points, time, raw_max=None):
+    """
+        Function to turn analog trace into list of logic level changes, from
+            same debounced 50% crossings as edge_times
+
+        INPUTS
+        :points: - np.array of y-points for trace
+        :time: - np.array of times for each point
+        :raw_max: - high level of trace, high_level of points if not given
+
+        OUTPUTS
+        :events: - np.array of EVENT_DTYPE, one per transition
+        :start: - logic level at first point
+    """
+    points = np.asarray(points)
+    time = np.asarray(time)
+    if raw_max is None:
+        raw_max = high_level(points)
+    half = raw_max * HALF_TRIGGER
+    inds = half_crossings(points, raw_max, time)
+
+    events = np.empty(len(inds), dtype=EVENT_DTYPE)
+    events['time'] = lp.interp_crossings(points, time, inds, half)
+    events['level'] = points[inds + 1] > points[inds]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        events['slew'] = (points[inds + 1] - points[inds]) / (time[inds + 1] - time[inds])
+
+    return events, int(points[0] > half)
+
+def digital_events(df, cols=None):
+    """
+        Function to digitize every column of simulation
+
+        OUTPUT
+        :events: - dict of column name to (events, start level) of digitize
+    """
+    time = df[TIME_COL].values
+    if cols is None:
+        cols = [c for c in df if c != TIME_COL]
+
+    return {col: digitize(df[col].values, time) for col in cols}
+
+def level_at(events, start, ts):
+    """
+        Function to get logic level of digitized trace just before each of
+            times :ts:, from last event before each time
+    """
+    idx = np.searchsorted(events['time'], ts, side='left')
+    if not len(events):
+        return np.full(len(idx), start, dtype=int)
+
+    return np.where(idx > 0, events['level'][np.maximum(idx - 1, 0)], start).astype(int)
+
+def jk_outputs(j, k, q0=0):
+    """
+        Function to get JK flip-flop output after each clock edge without
+            looping over cycles. Set and reset fix Q, hold and toggle are
+            worked out from parity of toggles since last set or reset
+    
+        INPUTS
+        :j, k: - np.arrays of 0/1 inputs at each clock edge
+        :q0: - output before first edge
+    
+        OUTPUT
+        :q: - np.array of output after each edge
+    """
+    j = np.asarray(j, dtype=bool)
+    k = np.asarray(k, dtype=bool)
+    fixed = j != k
+    toggle = (j & k).astype(int)
+    
+    # Last set or reset at or before each edge, -1 if none yet
+    idx = np.arange(len(j))
+    last = np.maximum.accumulate(np.where(fixed, idx, -1))
+    base = np.where(last >= 0, j[np.maximum(last, 0)], bool(q0))
+    toggles = np.cumsum(toggle)
+    since = toggles - np.where(last >= 0, toggles[np.maximum(last, 0)], 0)
+    
+    return (base ^ (since % 2 == 1)).astype(int)
+    
+def jk_check(events, cols=JK_COLS):
+    """
+        Function to check digitized JK flip-flop run against JK truth table.
+            J and K are read just before each rising clock edge and Q and QB
+            just before the next one, so every cycle is checked at once
+            however long the run is. Last edge has no next edge to read
+            outputs at, so is not checked
+
+        INPUTS
+        :events: - dict of column name to (events, start level), such as
+            from digital_events
+        :cols: - dict of 'clk', 'j', 'k', 'q' and 'qb' to column names
+
+        OUTPUT
+        :cycles: - pd.DataFrame with 'time' of each checked clock edge, 'j',
+            'k', 'expected' Q, 'q', 'qb' and 'ok' columns. Q before first
+            edge is taken as is, so first cycle is checked from there
+    """
+    clk, _ = events[cols['clk']]
+    rising = clk['time'][clk['level'] == 1]
+    edges, settled = rising[:-1], rising[1:]
+    j = level_at(*events[cols['j']], edges)
+    k = level_at(*events[cols['k']], edges)
+    q0 = level_at(*events[cols['q']], edges[:1])
+    expected = jk_outputs(j, k, q0[0] if len(q0) else 0)
+
+    # Outputs have settled by next rising edge
+    q = level_at(*events[cols['q']], settled)
+    qb = level_at(*events[cols['qb']], settled)
+
+    return pd.DataFrame({'time': edges, 'j': j, 'k': k, 'expected': expected,
+                        'q': q, 'qb': qb, 'ok': (q == expected) & (qb != q)})
+
+def jk_check_dir(data_dir=DATA_DIR, ext='.csv'):
+    """
+        Function to check every JK flip-flop CSV in directory against JK
+            truth table with jk_check, printing cycles matched and size of
+            events of each file. Files without JK_COLS columns are skipped
+
+        OUTPUT
+        :checks: - dict of filename to jk_check table
+    """
+    checks = {}
+    for f in sorted(os.listdir(data_dir)):
+        if not f.lower().endswith(ext):
+            continue
+        df = lc.read_csv_cached(os.path.join(data_dir, f))
+        if not set(JK_COLS.values()) <= set(df):
+            print('%s: skipped, no %s columns' % (f, ', '.join(JK_COLS.values())))
+            continue
+        events = digital_events(df)
+        checks[f] = cycles = jk_check(events)
+        print('%s: %s of %s cycles match JK truth table (%s events, %.1f kB)' %
+                (f, cycles['ok'].sum(), len(cycles),
+                sum(len(e) for e, start in events.values()),
+                sum(e.nbytes for e, start in events.values()) / 1e3))
+        for t in cycles['time'][~cycles['ok']].values[:10]:
+            print('    mismatch at clock edge %.1f ps' % (t / PS))
+
+    return checks
+
+def plot_file(filename, dt=SAMPLE_DT, profiler=None):
+    """
+        Function to load simulation CSV, put it on uniform time grid and
+            plot it for picking delays with mouse clicks
+
+        INPUTS
+        :filename: - CSV filename
+        :dt: - time step (s) run is resampled to, same number of points if None
+        :profiler: - lab3_profile.Profiler to record stages in
+    """
+    prof = profiler if profiler is not None else lpf.NULL
+    with prof.stage('load') as entry:
+        df = load_data(filename, print_cols=True)
+        entry['samples'] = df.shape[0]
+    # Simulator steps are not uniform, put run on uniform grid so samples
+        # are a fixed amount of time
+    with prof.stage('resample') as entry:
+        df = lr.resample(df, dt=dt, time_col=TIME_COL)
+        entry['samples'] = df.shape[0]
+    dt = df[TIME_COL].values[1] - df[TIME_COL].values[0]
+    df = df.drop(labels=TIME_COL, axis=1)
+    f = os.path.basename(filename)
+    plot_data(df, separate=True, savename='.'.join(f.split('.')[:-1]),
+                clockOverlayCol=CLK_COL, replace_on_ylabel=[' (V)'], dt=dt,
+                profiler=profiler)
+
 def plot_data(data, separate=False, savename=False, clockOverlayCol=False,
-                replace_on_ylabel=[]):
+                replace_on_ylabel=[], dt=None, profiler=None):
+    # Stages of plotting are recorded when a lab3_profile.Profiler is given
+    prof = profiler if profiler is not None else lpf.NULL
+    
     if clockOverlayCol:
         clk = data[clockOverlayCol]
         del data[clockOverlayCol]
         
     if separate:
-        global fig, halfs_data, halfs_clock, TOP_TRIGGER
+        global fig, halfs_data, halfs_clock, half_levels, TOP_TRIGGER, sample_dt
+        sample_dt = dt
         halfs_data = {}
         halfs_clock = {}
+        half_levels = {}
         
         fig, axes = plt.subplots(nrows=data.shape[1], sharex=True)
         
         for i, col in enumerate(sorted(set(list(data)))):
-            TOP_TRIGGER = max(data[col])
+            TOP_TRIGGER = high_level(data[col].values)
             ylabel_text = str(col)
             for r in replace_on_ylabel:
                 ylabel_text = ylabel_text.replace(str(r), '')
@@ -82,28 +412,29 @@ def plot_data(data, separate=False, savename=False, clockOverlayCol=False,
             if i == 0:
                 axes[i].set_title('Simulation Waveforms')
             axes[i].set_ylabel(ylabel_text)
-            axes[i].plot(data[col])
-            axes[i].spines['top'].set_visible(False)
-            axes[i].spines['right'].set_visible(False)
-            
-            if clockOverlayCol:
-                axes[i].plot(clk, linestyle='--') # marker='.')
+            samples = np.arange(data.shape[0])
+            # Time of each sample for dwell of glitches, runs are resampled
+                # to even steps
+            sample_ts = samples * dt if dt else samples
+            with prof.stage('plot', col, data.shape[0]):
+                ld.plot_decimated(axes[i], samples, data[col].values)
+                axes[i].spines['top'].set_visible(False)
+                axes[i].spines['right'].set_visible(False)
+                
+                if clockOverlayCol:
+                    ld.plot_decimated(axes[i], samples, clk.values, linestyle='--') # marker='.')
             if i == len(list(data))-1:
-                axes[i].set_xlabel('Samples (1 Sample = 1 ps)')
+                axes[i].set_xlabel('Samples (1 Sample = %g ps)' % (dt/PS) if dt
+                                    else 'Samples')
             
-            half = np.array([TOP_TRIGGER * HALF_TRIGGER]*len(data[col]))
-            h_ind = np.argwhere(np.diff(np.sign(data[col] - half))).flatten()
-            h_clk = np.argwhere(np.diff(np.sign(clk - half))).flatten()
-            halfs_data[axes[i]] = []
-            halfs_clock[axes[i]] = []
-            for j, val in enumerate(h_ind):
-                if not j == len(h_ind)-1:
-                    if abs(val - h_ind[j+1]) > 10:
-                        halfs_data[axes[i]].append(val)
-                        halfs_clock[axes[i]].append(h_clk[j])
-                else:
-                    halfs_data[axes[i]].append(val)
-                    halfs_clock[axes[i]].append(h_clk[j])
+            # 50% points indexed per axes so clicks only need a bisect lookup
+            with prof.stage('half_crossings', col, data.shape[0]):
+                halfs_data[axes[i]] = half_crossings(data[col].values, TOP_TRIGGER,
+                                                        sample_ts)
+                half_levels[axes[i]] = TOP_TRIGGER*HALF_TRIGGER
+                if clockOverlayCol:
+                    halfs_clock[axes[i]] = half_crossings(clk.values,
+                                                        high_level(clk.values), sample_ts)
             
         
         plt.subplots_adjust(hspace=0.2)
@@ -117,21 +448,46 @@ def plot_data(data, separate=False, savename=False, clockOverlayCol=False,
         
     if savename:
         outfile = os.path.join(PLOT_DIR, savename + '.png')
-        plt.savefig(outfile)
+        with prof.stage('savefig'):
+            plt.savefig(outfile)
         
     cid = fig.canvas.mpl_connect('button_press_event', onclick)
+    fig.canvas.mpl_connect('draw_event', ondraw)
     plt.xlim([0, 50000])
     plt.show()
     
+def ondraw(event):
+    # Save figure without markers after every full draw (first show, zoom,
+        # resize) so clicks only have to redraw markers on top of it
+    global background
+    background = fig.canvas.copy_from_bbox(fig.bbox)
+    for p in delayPoints['p']:
+        fig.draw_artist(p)
+    
+def blit_markers():
+    # Redraws only the markers over saved background
+    if not fig.canvas.supports_blit or background is None:
+        fig.canvas.draw_idle()
+        return
+    fig.canvas.restore_region(background)
+    for p in delayPoints['p']:
+        fig.draw_artist(p)
+    fig.canvas.blit(fig.bbox)
+    
 def onclick(event):
     """
     print('%s click: button=%d, x=%d, y=%d, xdata=%f, ydata=%f, axes=%s' %
           ('double' if event.dblclick else 'single', event.button,
            event.x, event.y, event.xdata, event.ydata, event.inaxes))
     """
+    if event.inaxes not in halfs_data:
+        return
+    
     # Gets closest 50% point
-    xdata = getClosest(event.xdata, halfs_data[event.inaxes], halfs_clock[event.inaxes])
-    xdata = event.xdata
+    xdata = getClosest(event.xdata, halfs_data[event.inaxes],
+                        halfs_clock.get(event.inaxes, []))
+    if xdata is None:
+        xdata = event.xdata
     delayPoints['x'].append(xdata)
     
     # If 2 plots have already been plotted and new click comes in, delete previous point
@@ -140,31 +496,56 @@ def onclick(event):
             p.remove()
         delayPoints['p'] = []
     elif len(delayPoints['x']) > 1: # If 2 x points, output difference
-        print(abs(xdata - delayPoints['x'][0]), 'samples of delay')
+        delay = abs(xdata - delayPoints['x'][0])
+        if sample_dt:
+            print(delay, 'samples of delay (%.4g ps)' % (delay*sample_dt/PS))
+        else:
+            print(delay, 'samples of delay')
         delayPoints['x'] = []
         
-    # Plots chosen point
-    delayPoints['p'].append(event.inaxes.plot(xdata, TOP_TRIGGER*HALF_TRIGGER, 'o', c='r')[0])
-    fig.canvas.draw()
-    fig.canvas.flush_events() #Put on all points
+    # Plots chosen point, animated so it is left out of full draws and blitted
+    delayPoints['p'].append(event.inaxes.plot(xdata, half_levels[event.inaxes], 'o',
+                                                c='r', animated=True)[0])
+    blit_markers()
+    
+def nearest(xpoint, halfs):
+    # Bisects sorted 50% points, closest is one of the two either side
+    if not len(halfs):
+        return None
+    i = np.searchsorted(halfs, xpoint)
+    if i == len(halfs) or (i > 0 and xpoint - halfs[i-1] <= halfs[i] - xpoint):
+        i -= 1
+    
+    return halfs[i]
     
 def getClosest(xpoint, data_halfs, clk_halfs):
-    # Gets abs of difference, smallest value is closest to chosen point
-    data = [abs(xpoint - val) for val in data_halfs]
-    clk = [abs(xpoint - val) for val in clk_halfs]
+    # Closest 50% point of data and of clock, data is kept on a tie
+    data = nearest(xpoint, data_halfs)
+    clk = nearest(xpoint, clk_halfs)
     
-    if min(data) > min(clk):
-        data = clk_halfs[clk.index(min(clk))]
-    else:
-        data = data_halfs[data.index(min(data))]
+    if data is None or (clk is not None and abs(xpoint - data) > abs(xpoint - clk)):
+        data = clk
     
     return data
     
 if __name__ == '__main__':
-    delayPoints = {'p': [], 'x': []}
+    if '--delays' in sys.argv:
+        # Headless clock to output delays of every CSV in data directory
+        print(delay_summary(clk_q_dir(DATA_DIR)).to_string())
+        sys.exit()
+    if '--check' in sys.argv:
+        # Check every CSV in data directory against JK truth table from
+            # digitized events, without plotting
+        jk_check_dir(DATA_DIR)
+        sys.exit()
     
-    f = get_files(DATA_DIR)
-    df = load_data(f, exclude=['time (s)'], print_cols=True)
-    f = f.split('\\')[-1]
-    plot_data(df, separate=True, savename='.'.join(f.split('.')[:-1]),
-                clockOverlayCol='CLK (V)', replace_on_ylabel=[' (V)'])
\ No newline at end of file
+    # Profile of run is written to file given after --profile
+    profiler = None
+    if '--profile' in sys.argv:
+        profiler = lpf.Profiler()
+    
+    plot_file(get_files(DATA_DIR), profiler=profiler)
+    
+    if profiler:
+        print(profiler.totals())
+        profiler.save(sys.argv[sys.argv.index('--profile') + 1])
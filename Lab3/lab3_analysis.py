@@ -1,8 +1,16 @@
-import matplotlib.pyplot as plt
-import pandas as pd
 import numpy as np
 import lab3_processing as lp
-import json, os
+import lab3_cache as lc
+import lab3_store as ls
+import lab3_decimate as ld
+import lab3_netlist as ln
+import lab3_profile as lpf
+import lab3_waveform as lw
+import lab3_lazy as ll
+import os
+
+# Only imported once something is plotted
+plt = ll.lazy_import('matplotlib.pyplot')
 
 # Data filename, time points column name, input wave column name
 OSC_DATA = os.path.join('data', 'oscillator-3.csv')
@@ -11,6 +19,8 @@ INPUT_COL = 'net1 (V)'
 TOP_TRIGGER = 0.8 # Calculate rise/fall times 20%-80%
 BOT_TRIGGER = 0.2
 HALF_TRIGGER = 0.5 # 50%
+HYSTERESIS = 0.05 # Debounce crossings with +/-5% band around each trigger
+MIN_DWELL = 0 # Edges closer together than this (seconds) are glitches
 
 def allPlots(df):
     """
@@ -18,20 +28,20 @@ def allPlots(df):
     """
     
     # Create xrange for plots
-    x = range(df.shape[0])
+    x = np.arange(df.shape[0])
     
     # Scale through output trace columns and plot each one
     for i, net in enumerate(list(df)):
         if net == TIME_COL:
             continue
-        # Get output trace series, convert to list
-        points = df[net].tolist()
+        # Get output trace points
+        points = df[net].values
         
         trace = '--'
         if i%2==0:
             trace='-'
-        # Put on plot  
-        plt.plot(x, points, trace, label=net)
+        # Put min/max envelope of trace on plot
+        ld.plot_decimated(plt.gca(), x, points, trace, label=net)
 
     plt.title('Oscillator Simulated Results')
     plt.xlabel('Time (S x 10e-9)')
@@ -41,130 +51,186 @@ def allPlots(df):
     # Show plot
     plt.show()
     
-def riseFall_times(df, showPlot=1, saveJson=False, skipPlots=True, inv_eval=0):
+def trigger_params():
     """
-        Function to find rise and fall indicies of x-axis for output traces
-        
+        Function to get trigger and debounce settings as dict, read from
+            module constants when called. Worker processes do not see
+            constants changed in parent under spawn or forkserver, so this
+            is handed to them instead
+    """
+    return {'top_trigger': TOP_TRIGGER, 'bot_trigger': BOT_TRIGGER,
+            'half_trigger': HALF_TRIGGER, 'hysteresis': HYSTERESIS,
+            'min_dwell': MIN_DWELL}
+    
+def trigger_levels(raw_max, params=None):
+    """
+        Function to get levels crossings are found for. Top, bot and half
+            triggers each with lower and upper edge of hysteresis band
+            
         INPUTS
-        :df: - dataframe of points for inverter net traces
-        :showPlot: - bool for whether plots should be shown of traces
-        :saveJson: - string of filename to save records dict to or False to not save
-        :skipPlots: - bool of whether to skip some plot outputs
+        :raw_max: - max value of trace
+        :params: - trigger_params dict, module constants if not given
         
         OUTPUT
-        :records: - dict of processed data
+        :band_levels: - list of levels to pass to lab3_processing.find_crossings
     """
-    # Get time in np.array then remove from dataframe so only y-points are iterated
-    time = df[TIME_COL].values
-    del df[TIME_COL]
+    p = params if params is not None else trigger_params()
+    levels = [raw_max * p['top_trigger'], raw_max * p['bot_trigger'], 
+                raw_max * p['half_trigger']]
     
-    # Create records variable
-    records = {}
-    for i, net in enumerate(list(df)):
-        # Create records entry for net
-        records[net] = {'top': [], 'bot': [], 'half': []}
-        
-        # Get points in np.arrays then determine top and bottom values
-            # to calculate rise time between
-        points = df[net].values
-        raw_max = max(points)
-        
-        # Create arrays of 80% value, 50% value and 20% value
-        top = np.array([raw_max * TOP_TRIGGER]*len(points))
-        bot = np.array([raw_max * BOT_TRIGGER]*len(points))
-        half = np.array([raw_max * HALF_TRIGGER]*len(points))
+    return lp.hysteresis_levels(levels, raw_max * p['hysteresis'])
+    
+def net_crossings(points, time, raw_max=None, coding=None, block=None, params=None):
+    """
+        Function to get debounced top, bot and half crossings of trace
         
-        # Find points of intersections between points and top/bot thresholds
-        t_ind = np.argwhere(np.diff(np.sign(points - top))).flatten()
-        b_ind = np.argwhere(np.diff(np.sign(points - bot))).flatten()
-        h_ind = np.argwhere(np.diff(np.sign(points - half))).flatten()
+        INPUTS
+        :points: - np.array of trace y-points
+        :time: - np.array of trace x-points
+        :raw_max: - max value of trace (V), found from points if not given
+        :coding: - (scale, offset) when :points: are stored values such as
+            int16 of lab3_waveform.Waveforms, voltage is value * scale + offset.
+            Levels are moved into stored units instead of decoding points
+        :block: - points banded at a time, see lab3_processing.find_crossings
+        :params: - trigger_params dict, module constants if not given
         
-        t_ind, b_ind, h_ind = lp.clear_range(t_ind, b_ind, h_ind)
+        OUTPUTS
+        :inds: - list of top, bot and half crossing indicies
+        :ts: - list of top, bot and half interpolated crossing times
+    """
+    p = params if params is not None else trigger_params()
+    scale, offset = coding if coding is not None else (1, 0)
+    if raw_max is None:
+        raw_max = np.max(points) * scale + offset
+    band_levels = (np.asarray(trigger_levels(raw_max, p)) - offset) / scale
+    inds, ts = lp.find_crossings(points, band_levels, time, block)
+    
+    return lp.debounce_crossings(inds, ts, band_levels, points[0], p['min_dwell'])
+    
+def crossing_record(inds, ts, time):
+    """
+        Function to turn top, bot and half crossings of a net into a records
+            entry of paired rising and falling edges with rise and fall times
+            
+        INPUTS
+        :inds: - list of debounced top, bot and half crossing indicies
+        :ts: - list of top, bot and half interpolated crossing times
+        :time: - timescale for :inds:
         
-        # Record intersections indicies
-        records[net]['top'] = t_ind
-        records[net]['bot'] = b_ind
-        records[net]['half'] = h_ind
-        records[net]['half_ts'] = time[h_ind]
+        OUTPUT
+        :record: - dict of processed data for net
+    """
+    # Record intersections indicies and times
+    record = {}
+    record['top'] = inds[0]
+    record['bot'] = inds[1]
+    record['half'] = inds[2]
+    record['top_ts'] = ts[0]
+    record['bot_ts'] = ts[1]
+    record['half_ts'] = ts[2]
 
-        # Filter out unpaired top or bottom intercepts
-        records[net] = lp.remove_unpaired(records[net])
-        
-        # Get pairs indicies for rising and falling edges
-        # NOTE: Rise and fall pairs are with orientation of...
-            #       [top x-index, bot x-index]
-        rise, fall, rise_half, fall_half = lp.get_risefall_inds(records[net])
-        records[net]['rise'] = rise
-        records[net]['fall'] = fall
-        records[net]['rise_half'] = rise_half
-        records[net]['fall_half'] = fall_half
-        
-        # Calculate rise and fall times
-        rise_ts, fall_ts = lp.calc_riseFall_times(records[net], time)
-        
-        # Keep rise and fall calculated times
-        records[net]['rise_ts'] = rise_ts
-        records[net]['fall_ts'] = fall_ts
-        
-        if INPUT_COL in records and not net == INPUT_COL:
-            records[net]['initial_input'] = 'False, see %s' % INPUT_COL
-            #print(records[INPUT_COL]['rise_half'], records[INPUT_COL]['fall_half'])
-            rise_prop_ts, fall_prop_ts, prop_ts = lp.calc_prop_times(records[net], 
-                                                            records[INPUT_COL], 
-                                                            time)
-                                                            
-            records[net]['rise_prop_ts'] = rise_prop_ts
-            records[net]['fall_prop_ts'] = fall_prop_ts
-            records[net]['prop_ts'] = prop_ts
+    # Pair crossings into complete rising and falling edges
+    rise_edges, fall_edges = lp.pair_edges(record, time)
+    record['rise_edges'] = rise_edges
+    record['fall_edges'] = fall_edges
+    
+    # Get pairs indicies for rising and falling edges
+    # NOTE: Rise and fall pairs are with orientation of...
+        #       [top x-index, bot x-index]
+    record['rise'] = np.column_stack([rise_edges['end'], rise_edges['start']])
+    record['fall'] = np.column_stack([fall_edges['start'], fall_edges['end']])
+    record['rise_half'] = rise_edges['mid']
+    record['fall_half'] = fall_edges['mid']
+    
+    # Calculate rise and fall times
+    rise_ts, fall_ts = lp.calc_riseFall_times(record, time)
+    
+    # Keep rise and fall calculated times
+    record['rise_ts'] = rise_ts
+    record['fall_ts'] = fall_ts
+    
+    return record
+    
+def prop_record(records, net, time, inv_eval=0, input_col=None):
+    """
+        Function to add propagation times of net to its records entry. Input
+            net is evaluated against itself, all others against input net
             
-        elif net == INPUT_COL:
-            records[net]['initial_input'] = 'True'
+        INPUTS
+        :records: - dict of processed data, including INPUT_COL entry
+            for any net other than INPUT_COL
+        :net: - net name to add propagation times for
+        :time: - timescale for records indicies
+        :inv_eval: - bool of whether a single inverter is being evaluated
+        :input_col: - input net name, INPUT_COL if not given
+        
+        OUTPUT
+        :inv_eval: - :inv_eval: input, set if input net could not be evaluated
+            as oscillator
+    """
+    if input_col is None:
+        input_col = INPUT_COL
+        
+    if input_col in records and not net == input_col:
+        records[net]['initial_input'] = 'False, see %s' % input_col
+        #print(records[input_col]['rise_half'], records[input_col]['fall_half'])
+        rise_prop_ts, fall_prop_ts, prop_ts = lp.calc_prop_times(records[net], 
+                                                        records[input_col], 
+                                                        time)
+                                                        
+        records[net]['rise_prop_ts'] = rise_prop_ts
+        records[net]['fall_prop_ts'] = fall_prop_ts
+        records[net]['prop_ts'] = prop_ts
             
-            try:
-                if not inv_eval:
-                    rise_prop_ts, fall_prop_ts, prop_ts = lp.osc_prop_time(records[net],
-                                                                            time)
-                    records[net]['osc_rise_prop_ts'] = rise_prop_ts
-                    records[net]['osc_fall_prop_ts'] = fall_prop_ts
-                    records[net]['prop_ts'] = prop_ts
-            except Exception as e:
-                print('Error hit... If evaluating for single inverter this is fine.')
-                inv_eval = 1
-                del records[net]['osc_rise_prop_ts']
-                del records[net]['osc_fall_prop_ts']
-                del records[net]['prop_ts']
-                
-        else:
-            raise Exception('No input recorded to reference, INPUT_COL ' + 
-                            'must be same as first for loop iteration net')
-
-        # Skip any iterations where i%3!=0
-        if not i % 4 == 0 and skipPlots:
-            continue
+    elif net == input_col:
+        records[net]['initial_input'] = 'True'
             
-        if showPlot:
-            # Only on first iteration, plot 80%, 50% and 20% lines
-            if i == 0:
-                plt.plot(time, top, '--', label='80%')
-                plt.plot(time, bot, '--', label='20%')
-                plt.plot(time, half, '--', label='50%')
+        try:
+            if not inv_eval:
+                rise_prop_ts, fall_prop_ts, prop_ts = lp.osc_prop_time(records[net],
+                                                                        time)
+                records[net]['osc_rise_prop_ts'] = rise_prop_ts
+                records[net]['osc_fall_prop_ts'] = fall_prop_ts
+                records[net]['prop_ts'] = prop_ts
+        except Exception as e:
+            print('Error hit... If evaluating for single inverter this is fine.')
+            inv_eval = 1
+            records[net].pop('osc_rise_prop_ts', None)
+            records[net].pop('osc_fall_prop_ts', None)
+            records[net].pop('prop_ts', None)
                 
-            # Plot traces and intersectins
-            #plt.plot(time[t_ind], points[t_ind], 'go') # Top intersections
-            #plt.plot(time[b_ind], points[b_ind], 'bo') # Bottom intersections
-            #plt.plot(time[h_ind], points[h_ind], 'ro') # Halfway intersetions
-            
-            # 20% - 80% rising edges (black dots)
-            plt.plot(time[list(rise[:, 0])], points[list(rise[:, 0])], 'k*', markersize=13.0)
-            plt.plot(time[list(rise[:, 1])], points[list(rise[:, 1])], 'k*', markersize=13.0)
-            plt.plot(time[list(rise_half)], points[list(rise_half)], 'k*', markersize=13.0)
-            # 80% - 20% falling edges (blue dots)
-            plt.plot(time[list(fall[:, 0])], points[list(fall[:, 0])], 'bo', markersize=9.5)
-            plt.plot(time[list(fall[:, 1])], points[list(fall[:, 1])], 'bo', markersize=9.5)
-            plt.plot(time[list(fall_half)], points[list(fall_half)], 'bo', markersize=9.5)
-            # Actual inverter curve
-            plt.plot(time, points, label='Inv %s' % i)
+    else:
+        raise Exception('No input recorded to reference, %s ' % input_col + 
+                        'must be same as first for loop iteration net')
         
+    return inv_eval
+    
+def stage_record(records, net, driver, time):
+    """
+        Function to add propagation times of net against net driving it, so
+            each stage of ring gets its own delay. Edge polarity is picked
+            automatically by lab3_processing.calc_prop_times
+            
+        INPUTS
+        :records: - dict of processed data, including :driver: entry
+        :net: - net name to add stage propagation times for
+        :driver: - net name driving :net:, nothing is added if None
+        :time: - timescale for records indicies
+    """
+    if driver is None or driver not in records:
+        return
+    rise_prop_ts, fall_prop_ts, prop_ts = lp.calc_prop_times(records[net], 
+                                                    records[driver], time)
+    records[net]['driver'] = driver
+    records[net]['stage_rise_prop_ts'] = rise_prop_ts
+    records[net]['stage_fall_prop_ts'] = fall_prop_ts
+    records[net]['stage_prop_ts'] = prop_ts
+    
+def mean_prop_times(records):
+    """
+        Function to add mean rise and fall propagation times across all
+            inverters to records as 'all_invs' entry
+    """
     if len(records) > 4:
         mean_rise = []
         mean_fall = []
@@ -179,25 +245,150 @@ def riseFall_times(df, showPlot=1, saveJson=False, skipPlots=True, inv_eval=0):
         records['all_invs'] = {}
         records['all_invs']['mean_rise_prop_ts'] = np.mean(mean_rise)
         records['all_invs']['mean_fall_prop_ts'] = np.mean(mean_fall)
+        
+        # Mean delay of single stage when delays against drivers were found
+        stage_ts = [records[net]['stage_prop_ts'] for net in records
+                    if 'stage_prop_ts' in records[net]]
+        if stage_ts:
+            records['all_invs']['mean_stage_prop_ts'] = np.mean(stage_ts)
+        
+def save_records(records, saveJson):
+    """
+        Function to save records dict to JSON sidecar file with arrays kept
+            in typed binary .npz file next to it. Load with
+            lab3_store.load_records
+        
+        INPUTS
+        :records: - dict of processed data
+        :saveJson: - string of filename to save records to
+    """
+    ls.save_records(records, saveJson)
+    print('Records saved!')
+        
+def riseFall_times(df, showPlot=1, saveJson=False, skipPlots=True, inv_eval=0,
+                    netlist=None, profiler=None, memory_budget=None, input_col=None,
+                    params=None):
+    """
+        Function to find rise and fall indicies of x-axis for output traces
+        
+        INPUTS
+        :df: - dataframe of points for inverter net traces, or
+            lab3_waveform.Waveforms of them. Not changed
+        :showPlot: - bool for whether plots should be shown of traces
+        :saveJson: - string of filename to save records dict to or False to not save
+        :skipPlots: - bool of whether to skip some plot outputs
+        :netlist: - netlist filename, if given nets are evaluated in signal
+            path order starting from its first net and each net also gets
+            propagation times against its driver
+        :profiler: - lab3_profile.Profiler to record time, samples and peak
+            memory of each stage and net in, nothing recorded if not given
+        :memory_budget: - bytes of working arrays finding crossings of a net
+            may use, whole net at once if not given
+        :input_col: - net propagation times are referenced to, INPUT_COL if
+            not given. First net of signal path is used with :netlist:
+        :params: - trigger_params dict of trigger levels and debounce
+            settings, module constants if not given
+        
+        OUTPUT
+        :records: - dict of processed data
+    """
+    prof = profiler if profiler is not None else lpf.NULL
+    params = params if params is not None else trigger_params()
+    block = lw.block_size(memory_budget) if memory_budget else None
+    
+    # Get time in np.array, y-points are every other column
+    wf = df if isinstance(df, lw.Waveforms) else None
+    time = wf.time if wf is not None else df[TIME_COL].values
+    columns = [net for net in df if net != TIME_COL]
+    
+    # Put nets in signal path order, any not in netlist go after
+    order = ln.column_order(columns, netlist) if netlist else []
+    nets = [net for net, driver in order]
+    nets += [net for net in columns if net not in nets]
+    if order:
+        input_col = nets[0]
+    elif input_col in nets:
+        nets.remove(input_col)
+        nets.insert(0, input_col)
+    
+    # Create records variable
+    records = {}
+    for i, net in enumerate(nets):
+        # Get points in np.arrays then determine top and bottom values
+            # to calculate rise time between. Waveforms are kept as stored
+        if wf is not None:
+            points, coding = wf.codes(net), wf.coding(net)
+            raw_max = wf.max(net)
+        else:
+            points, coding = df[net].values, None
+            raw_max = np.max(points)
+        
+        # Levels of 80% value, 20% value and 50% value
+        levels = [raw_max * params['top_trigger'], raw_max * params['bot_trigger'], 
+                    raw_max * params['half_trigger']]
+        
+        # Find points of intersections between points and top/bot thresholds
+            # in one pass, along with interpolated intersection times
+        with prof.stage('crossings', net, len(points)):
+            inds, ts = net_crossings(points, time, raw_max, coding, block, params)
+        with prof.stage('pair_edges', net, len(inds[2])):
+            records[net] = crossing_record(inds, ts, time)
+        
+        # Add propagation times against input net
+        with prof.stage('prop_times', net, len(inds[2])):
+            inv_eval = prop_record(records, net, time, inv_eval, input_col)
+
+        # Skip any iterations where i%3!=0
+        if not i % 4 == 0 and skipPlots:
+            continue
+            
+        if showPlot:
+            with prof.stage('plot', net, len(points)):
+                if wf is not None:
+                    points = wf.values(net)
+                rise = records[net]['rise']
+                fall = records[net]['fall']
+                rise_half = records[net]['rise_half']
+                fall_half = records[net]['fall_half']
+            
+                # Only on first iteration, plot 80%, 50% and 20% lines
+                if i == 0:
+                    plt.axhline(levels[0], linestyle='--', label='80%')
+                    plt.axhline(levels[1], linestyle='--', label='20%')
+                    plt.axhline(levels[2], linestyle='--', label='50%')
                 
-    plt.xlabel('Time (s x 10^-9)')
-    plt.ylabel('Voltage (V)')
-    plt.title('Oscillator trace outputs')
+                # Plot traces and intersectins
+                #plt.plot(time[t_ind], points[t_ind], 'go') # Top intersections
+                #plt.plot(time[b_ind], points[b_ind], 'bo') # Bottom intersections
+                #plt.plot(time[h_ind], points[h_ind], 'ro') # Halfway intersetions
+            
+                # 20% - 80% rising edges (black dots)
+                plt.plot(time[list(rise[:, 0])], points[list(rise[:, 0])], 'k*', markersize=13.0)
+                plt.plot(time[list(rise[:, 1])], points[list(rise[:, 1])], 'k*', markersize=13.0)
+                plt.plot(time[list(rise_half)], points[list(rise_half)], 'k*', markersize=13.0)
+                # 80% - 20% falling edges (blue dots)
+                plt.plot(time[list(fall[:, 0])], points[list(fall[:, 0])], 'bo', markersize=9.5)
+                plt.plot(time[list(fall[:, 1])], points[list(fall[:, 1])], 'bo', markersize=9.5)
+                plt.plot(time[list(fall_half)], points[list(fall_half)], 'bo', markersize=9.5)
+                # Actual inverter curve
+                ld.plot_decimated(plt.gca(), time, points, label='Inv %s' % i)
+        
+    # Delay of each stage against its driver, once all nets have edges
+    with prof.stage('stage_delays', samples=len(order)):
+        for net, driver in order:
+            stage_record(records, net, driver, time)
+    with prof.stage('mean_prop_times'):
+        mean_prop_times(records)
+    
+    if showPlot:
+        plt.xlabel('Time (s x 10^-9)')
+        plt.ylabel('Voltage (V)')
+        plt.title('Oscillator trace outputs')
     
     # If filename is input to save to...
     if saveJson:
-        # Convert filename to string just incase
-        filename = str(saveJson)
-        # Check for JSON extension and add to filename if not found
-        if not filename.split('.')[-1].lower() == 'json':
-            filename += '.json'
-            
-        # Convert dictionary lists to strings
-        out_json = lp.arrays_to_strings(records)
-        
-        # Output JSON with indents for easy reading
-        json.dump(out_json, open(filename, 'w'), indent=4)
-        print('Records saved!')
+        with prof.stage('save'):
+            save_records(records, saveJson)
         
     # If chosen, put legend on plot and show plot
     if showPlot:
@@ -207,23 +398,39 @@ def riseFall_times(df, showPlot=1, saveJson=False, skipPlots=True, inv_eval=0):
         
     return records
     
-def print_times(records):
+def print_times(records, input_col=None):
     """
         Function to print rise and fall times calculated
         
-        INPUT
+        INPUTS
         :records: - resulting dictionary from riseFall_times function
+        :input_col: - net propagation times are referenced to, net records
+            mark as initial input if not given
     """
+    if input_col is None:
+        input_col = next((net for net, record in records.items()
+                            if record.get('initial_input') == 'True'), None)
     for net in list(records):
+        if 'rise_ts' not in records[net]:
+            continue
         print('\nNet:', net)
         print('Rise times:', records[net]['rise_ts'])
         print('Fall times:', records[net]['fall_ts'])
-        if not net == INPUT_COL:
+        if not net == input_col and 'rise_prop_ts' in records[net]:
             print('Rise propagation times:', records[net]['rise_prop_ts'])
             print('Fall propagation times:', records[net]['fall_prop_ts'])
+        if 'stage_prop_ts' in records[net]:
+            print('Stage propagation time from %s:' % records[net]['driver'],
+                    records[net]['stage_prop_ts'])
     
 if __name__ == '__main__':
-    osc_data = pd.read_csv(OSC_DATA)
+    # Profile report filename, False to not profile run
+    PROFILE_OUTPUT = os.path.join('data', 'lab3_profile.json')
+    profiler = lpf.Profiler() if PROFILE_OUTPUT else None
+    
+    with (profiler or lpf.NULL).stage('load') as entry:
+        osc_data = lc.read_csv_cached(OSC_DATA)
+        entry['samples'] = osc_data.shape[0]
     print('Data shape:', osc_data.shape)
     print('Columns:', list(osc_data))
     
@@ -236,6 +443,10 @@ if __name__ == '__main__':
         
     records = riseFall_times(osc_data, showPlot=PLOTS_ON, 
                             saveJson=JSON_OUTPUT, skipPlots=not PLOTS_ON,
-                            inv_eval=0)
+                            inv_eval=0, netlist=ln.NETLIST, profiler=profiler)
+    
+    if profiler:
+        print(profiler.totals())
+        profiler.save(PROFILE_OUTPUT)
     
     #print_times(records)
\ No newline at end of file
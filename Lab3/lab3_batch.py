@@ -0,0 +1,245 @@
+import numpy as np
+import lab3_analysis as la
+import lab3_cache as lc
+import lab3_netlist as ln
+import lab3_store as ls
+from multiprocessing import Pool, shared_memory, resource_tracker
+import os
+
+# Data directory to analyze and number of files kept in shared memory at once
+DATA_DIR = 'data'
+FILES_IN_FLIGHT = 2
+
+def _net_crossings(task):
+    """
+        Pool worker function to find debounced top, bot and half crossings
+            of one net. Waveform block is attached from shared memory by name
+            so only the crossings are sent back to parent process
+
+        INPUT
+        :task: - tuple of (shared memory name, block shape, dtype string,
+            net row in block, max value of net, trigger_params dict)
+
+        OUTPUT
+        :(row, inds, ts): - net row with its crossing indicies and times
+    """
+    name, shape, dtype, row, raw_max, params = task
+    # Worker shares parent's resource tracker, so attaching adds nothing to
+        # clean up and parent's unlink is the only unregister needed
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        block = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        inds, ts = la.net_crossings(block[row], block[0], raw_max, params=params)
+        # Copy out of shared buffer before it is closed
+        ts = [np.array(t) for t in ts]
+        del block
+    finally:
+        shm.close()
+
+    return row, inds, ts
+
+def _share_file(filename, input_col, netlist=None):
+    """
+        Function to load CSV columns into one shared memory block with time
+            in first row and each net in its own row. Input net is put first
+            so propagation times can be referenced to it. With :netlist:
+            nets are put in signal path order instead
+
+        OUTPUT
+        :shm: - SharedMemory holding block
+        :block: - np.array view of block
+        :nets: - net names in row order, starting at row 1
+        :order: - column_order output of netlist, empty without :netlist:
+    """
+    columns = lc.load_columns(filename)
+    nets = [c for c in columns if c != la.TIME_COL]
+    order = ln.column_order(nets, netlist) if netlist else []
+    if order:
+        nets = [net for net, driver in order] + [net for net in nets if 
+                                                net not in dict(order)]
+        input_col = nets[0]
+    if input_col is None:
+        input_col = nets[0]
+    if input_col in nets:
+        nets.remove(input_col)
+        nets.insert(0, input_col)
+
+    shape = (len(nets) + 1, len(columns[la.TIME_COL]))
+    shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 8))
+    try:
+        block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        block[0] = columns[la.TIME_COL]
+        for i, net in enumerate(nets):
+            block[i + 1] = columns[net]
+    except BaseException:
+        block = None
+        _release(shm)
+        raise
+
+    return shm, block, nets, order
+
+def _release(shm):
+    # Close and remove shared memory block
+    shm.close()
+    shm.unlink()
+
+def _merge_file(nets, results, inv_eval, input_col, order=[]):
+    # Build records for one file from crossings found by workers
+    crossings = {row: (inds, ts) for row, inds, ts in results}
+    if input_col is None:
+        input_col = nets[0]
+
+    records = {}
+    for i, net in enumerate(nets):
+        inds, ts = crossings[i + 1]
+        records[net] = la.crossing_record(inds, ts, None)
+        inv_eval = la.prop_record(records, net, None, inv_eval, input_col)
+    for net, driver in order:
+        la.stage_record(records, net, driver, None)
+    la.mean_prop_times(records)
+
+    return records
+
+def _warm_cache(filename):
+    # Parse CSV into binary cache within worker so files are parsed in parallel
+    lc.load_columns(filename)
+
+def analyze_files(filenames, processes=None, input_col=None, inv_eval=0,
+                    netlist=None, params=None):
+    """
+        Function to analyze many simulation CSVs with a process pool. Every
+            net of every file is a separate task, waveform data is handed to
+            workers through shared memory instead of being pickled
+
+        INPUTS
+        :filenames: - list of CSV filenames
+        :processes: - number of worker processes, all cores if not given
+        :input_col: - net name propagation times are referenced to, first
+            net in each file if not given
+        :inv_eval: - bool of whether single inverters are being evaluated
+        :netlist: - netlist filename to order nets and add stage propagation
+            times with, first net of its signal path is then input net
+        :params: - lab3_analysis.trigger_params dict sent to every worker,
+            taken from lab3_analysis constants in this process if not given
+
+        OUTPUT
+        :records: - dict of filename to records dict, same as
+            lab3_analysis.riseFall_times gives for each file
+    """
+    params = params if params is not None else la.trigger_params()
+    records = {}
+    # Start resource tracker before pool so workers inherit it instead of
+        # each starting their own, which would unlink blocks when they exit
+    resource_tracker.ensure_running()
+    with Pool(processes) as pool:
+        # Files are parsed into cache first, one file per worker
+        pool.map(_warm_cache, filenames)
+
+        # Every block made is pending until its file is merged, so all of
+            # them are freed if any file fails
+        pending = []
+        block = None
+        try:
+            for n, f in enumerate(filenames):
+                shm, block, nets, order = _share_file(f, input_col, netlist)
+                entry = [f, shm, nets, order, None]
+                pending.append(entry)
+                raw_max = block[1:].max(axis=1)
+                tasks = [(shm.name, block.shape, block.dtype.str, i + 1, raw_max[i],
+                            params) for i in range(len(nets))]
+                block = None
+                entry[-1] = pool.map_async(_net_crossings, tasks)
+
+                # Limit how many files are held in shared memory at once
+                while len(pending) >= FILES_IN_FLIGHT or (pending and n == len(filenames) - 1):
+                    name, shm, nets, order, result = pending[0]
+                    records[name] = _merge_file(nets, result.get(), inv_eval,
+                                                nets[0] if order else input_col, order)
+                    pending.pop(0)
+                    _release(shm)
+        finally:
+            # Array over a block must go before the block can be closed, and
+                # workers are stopped so none attach to a block once removed
+            block = None
+            if pending:
+                pool.terminate()
+            for entry in pending:
+                _release(entry[1])
+
+    return records
+
+def _dir_files(data_dir, ext):
+    return sorted(os.path.join(data_dir, f) for f in os.listdir(data_dir)
+                    if f.lower().endswith(ext))
+
+def analyze_dir(data_dir=DATA_DIR, processes=None, input_col=None, ext='.csv',
+                netlist=None, inv_eval=0, params=None):
+    """
+        Function to analyze every CSV in directory with analyze_files
+    """
+    return analyze_files(_dir_files(data_dir, ext), processes=processes,
+                            input_col=input_col, inv_eval=inv_eval, netlist=netlist,
+                            params=params)
+
+def analysis_params(input_col=None, inv_eval=0, netlist=None, params=None):
+    """
+        Function to get every parameter records of a file depend on besides
+            its contents. Trigger levels are :params:, or read from
+            lab3_analysis when called, and netlist by its contents rather
+            than its name
+    """
+    params = dict(params if params is not None else la.trigger_params())
+    params.update({'input_col': input_col, 'inv_eval': inv_eval,
+                    'netlist': lc.file_hash(netlist) if netlist else None})
+
+    return params
+
+def refresh_files(filenames, processes=None, input_col=None, inv_eval=0,
+                    netlist=None, params=None):
+    """
+        Function to analyze many simulation CSVs, only analyzing files whose
+            contents or analysis parameters have changed since they were last
+            analyzed. Records of other files are loaded from cache, records
+            of newly analyzed files are cached for next time
+
+        INPUTS
+        :filenames, processes, input_col, inv_eval, netlist, params: - see
+            analyze_files. Same trigger params are used for cache key and
+            analysis
+
+        OUTPUTS
+        :records: - dict of filename to records dict, same as analyze_files
+        :analyzed: - list of filenames that were analyzed this time
+    """
+    params = params if params is not None else la.trigger_params()
+    key_params = analysis_params(input_col, inv_eval, netlist, params)
+    cached = {f: lc.result_file(f, key_params) for f in filenames}
+    analyzed = [f for f in filenames if not os.path.exists(cached[f])]
+
+    records = {}
+    if analyzed:
+        records = analyze_files(analyzed, processes=processes, input_col=input_col,
+                                inv_eval=inv_eval, netlist=netlist, params=params)
+        for f in analyzed:
+            ls.save_records(records[f], cached[f])
+    for f in filenames:
+        if f not in records:
+            records[f] = ls.load_records(cached[f])
+
+    return {f: records[f] for f in filenames}, analyzed
+
+def refresh_dir(data_dir=DATA_DIR, processes=None, input_col=None, ext='.csv',
+                netlist=None, inv_eval=0, params=None):
+    """
+        Function to bring records of every CSV in directory up to date with
+            refresh_files
+    """
+    return refresh_files(_dir_files(data_dir, ext), processes=processes,
+                            input_col=input_col, inv_eval=inv_eval, netlist=netlist,
+                            params=params)
+
+if __name__ == '__main__':
+    all_records, analyzed = refresh_dir(DATA_DIR)
+    for f in all_records:
+        print('%s: %s nets %s' % (f, len(all_records[f]),
+                                    'analyzed' if f in analyzed else 'from cache'))
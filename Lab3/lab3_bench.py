@@ -0,0 +1,237 @@
+import pandas as pd
+import numpy as np
+import lab3_analysis as la
+import lab3_processing as lp
+import lab3_decimate as ld
+import lab3_period as lpd
+import lab3_resample as lr
+import lab3_synth as sy
+import lab3_waveform as lw
+import lab3_lazy as ll
+import argparse, json, os, sys, time
+
+# Only imported once plotting is timed, after backend is picked
+plt = ll.lazy_import('matplotlib.pyplot')
+
+# Baseline timings file, sample counts timed and how much slower than
+    # baseline (fraction, and at least MIN_SLOWER seconds) counts as regression.
+    # Waveforms are made whole in memory, about 150 MB at peak per 10^6
+    # samples of an 11 stage ring, so 10^7 (a few GB with the pipeline's own
+    # copies) is the largest size timed
+BASELINE = os.path.join('data', 'bench_baseline.json')
+SIZES = [10**4, 10**5, 10**6, 10**7]
+MAX_SAMPLES = 10**6
+TOLERANCE = 0.25
+MIN_SLOWER = 5e-3
+
+# Keys of records compared between float64 and int16 storage, and largest
+    # time difference (s) allowed between them
+CHECK_KEYS = ('rise_ts', 'fall_ts', 'rise_prop_ts', 'fall_prop_ts',
+                'osc_rise_prop_ts', 'osc_fall_prop_ts')
+CHECK_ATOL = 1e-15
+
+def _best(func, repeat):
+    # Shortest of :repeat: wall times of func() and its last result
+    best = np.inf
+    for r in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+
+    return best, result
+
+def _find_crossings(df, nets, t):
+    # Raw crossings of every trigger and hysteresis band level, with levels
+    found = {}
+    for net in nets:
+        band_levels = la.trigger_levels(np.max(df[net].values))
+        found[net] = lp.find_crossings(df[net].values, band_levels, t) + (band_levels,)
+
+    return found
+
+def _debounce(df, found):
+    return {net: lp.debounce_crossings(inds, ts, band_levels, df[net].values[0],
+                                        la.MIN_DWELL)
+            for net, (inds, ts, band_levels) in found.items()}
+
+def _pair_edges(crossings):
+    # Same crossings record lab3_analysis.crossing_record pairs
+    return {net: lp.pair_edges({'top': inds[0], 'bot': inds[1], 'half': inds[2],
+                                'top_ts': ts[0], 'bot_ts': ts[1], 'half_ts': ts[2]})
+            for net, (inds, ts) in crossings.items()}
+
+def _records(crossings, t):
+    return {net: la.crossing_record(*crossings[net], t) for net in crossings}
+
+def _prop_times(records, t):
+    for net in records:
+        la.prop_record(records, net, t, 0, list(records)[0])
+
+def _plot(df, nets, t):
+    fig, ax = plt.subplots()
+    for net in nets:
+        ld.plot_decimated(ax, t, df[net].values)
+    fig.canvas.draw()
+    plt.close(fig)
+
+def bench_size(samples, stages=sy.STAGES, repeat=None, seed=0):
+    """
+        Function to time each pipeline stage on synthetic ring oscillator of
+            :samples: points with noise and adaptive time steps
+
+        INPUTS
+        :samples: - number of time points
+        :stages: - number of inverters in ring
+        :repeat: - runs of each stage, shortest is kept. 3 up to 10^6
+            samples, 1 above if not given
+        :seed: - random seed of waveforms
+
+        OUTPUT
+        :timings: - dict of stage name to wall time (s)
+    """
+    if repeat is None:
+        repeat = 3 if samples <= 10**6 else 1
+    timings = {}
+    timings['generate'], df = _best(lambda: sy.ring_oscillator(samples, stages,
+                                    noise=0.02, adaptive=1, seed=seed), repeat)
+    t = df[la.TIME_COL].values
+    nets = [net for net in df if net != la.TIME_COL]
+
+    timings['find_crossings'], found = _best(lambda: _find_crossings(df, nets, t),
+                                                repeat)
+    timings['debounce'], crossings = _best(lambda: _debounce(df, found), repeat)
+    timings['pair_edges'], _ = _best(lambda: _pair_edges(crossings), repeat)
+    timings['records'], records = _best(lambda: _records(crossings, t), repeat)
+    timings['prop_times'], _ = _best(lambda: _prop_times(records, t), repeat)
+    timings['riseFall_times'], records = _best(lambda: la.riseFall_times(
+                                    df, showPlot=0), repeat)
+    timings['edge_periods'], _ = _best(lambda: lpd.edge_periods(records), repeat)
+    timings['resample'], _ = _best(lambda: lr.resample(df), repeat)
+    timings['plot'], _ = _best(lambda: _plot(df, nets, t), repeat)
+
+    return timings
+
+def check_storage(samples=10**4, seed=0, atol=CHECK_ATOL):
+    """
+        Function to check int16 lab3_waveform.Waveforms give the same edges
+            and times as float64 frame. Edges take a single sample step, the
+            case where int16 differences of neighbouring points are largest
+
+        OUTPUT
+        :mismatches: - list of (net, key) where times differ by more than
+            :atol: or number of edges differs
+    """
+    df = sy.ring_oscillator(samples, edge_time=1e-15, noise=0.02, adaptive=1,
+                            seed=seed)
+    expected = la.riseFall_times(df, showPlot=0)
+    found = la.riseFall_times(lw.Waveforms.from_frame(df, dtype='int16'), showPlot=0)
+
+    mismatches = []
+    for net in expected:
+        for key in CHECK_KEYS:
+            if key not in expected[net]:
+                continue
+            a = np.asarray(expected[net][key])
+            b = np.asarray(found[net].get(key, []))
+            if a.shape != b.shape or not np.allclose(a, b, rtol=0, atol=atol):
+                mismatches.append((net, key))
+
+    return mismatches
+
+def run_bench(sizes=SIZES, max_samples=MAX_SAMPLES, stages=sy.STAGES):
+    """
+        Function to time every pipeline stage at each size up to :max_samples:
+
+        OUTPUT
+        :results: - dict of str(samples) to bench_size timings
+    """
+    results = {}
+    for samples in sizes:
+        if samples <= max_samples:
+            print('Timing %s samples...' % samples)
+            results[str(samples)] = bench_size(samples, stages)
+
+    return results
+
+def load_baseline(filename=BASELINE):
+    # Stored timings or empty dict when no baseline has been saved
+    try:
+        with open(filename) as f:
+            return json.load(f)['results']
+    except (OSError, ValueError, KeyError):
+        return {}
+
+def save_baseline(results, filename=BASELINE):
+    """
+        Function to store timings as baseline, sizes not in :results: keep
+            their stored timings
+    """
+    baseline = load_baseline(filename)
+    baseline.update(results)
+    with open(filename, 'w') as f:
+        json.dump({'version': 1, 'results': baseline}, f, indent=4)
+
+def regressions(results, baseline, tolerance=TOLERANCE, min_slower=MIN_SLOWER):
+    """
+        Function to find stages slower than baseline by more than :tolerance:
+            of baseline time (and more than :min_slower: seconds)
+
+        OUTPUT
+        :slower: - list of (samples, stage, time, baseline time) tuples
+    """
+    slower = []
+    for size, timings in results.items():
+        for stage, t in timings.items():
+            base = baseline.get(size, {}).get(stage)
+            if base is not None and t > base * (1 + tolerance) and t - base > min_slower:
+                slower.append((size, stage, t, base))
+
+    return slower
+
+def report(results, baseline={}):
+    """
+        Function to print timings (ms) of every size and stage, with change
+            from baseline where there is one
+    """
+    table = pd.DataFrame(results).T * 1e3
+    print('\nWall time (ms) by samples and stage:')
+    print(table.to_string(float_format='%.1f'))
+    if baseline:
+        base = pd.DataFrame(baseline).T.reindex_like(table) * 1e3
+        print('\nChange from baseline (%):')
+        print((100 * (table / base - 1)).to_string(float_format='%+.0f'))
+
+if __name__ == '__main__':
+    # Figures are only drawn to time them, never shown
+    import matplotlib
+    matplotlib.use('Agg')
+
+    parser = argparse.ArgumentParser(description='Time Lab 3 pipeline stages on '
+                                        'synthetic ring oscillator waveforms')
+    parser.add_argument('--max-samples', type=float, default=MAX_SAMPLES,
+                        help='largest size timed, up to 1e7 (a few GB)')
+    parser.add_argument('--stages', type=int, default=sy.STAGES)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true',
+                        help='store timings as new baseline')
+    args = parser.parse_args()
+
+    mismatches = check_storage()
+    for net, key in mismatches:
+        print('MISMATCH: int16 %s of %s differs from float64' % (key, net))
+    if mismatches:
+        sys.exit(1)
+
+    results = run_bench(max_samples=int(args.max_samples), stages=args.stages)
+    baseline = load_baseline(args.baseline)
+    report(results, baseline)
+
+    if args.save:
+        save_baseline(results, args.baseline)
+        print('\nBaseline saved to %s' % args.baseline)
+    else:
+        slower = regressions(results, baseline)
+        for size, stage, t, base in slower:
+            print('REGRESSION: %s at %s samples took %.1f ms, baseline %.1f ms' %
+                    (stage, size, t * 1e3, base * 1e3))
+        sys.exit(1 if slower else 0)
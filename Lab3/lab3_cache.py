@@ -0,0 +1,176 @@
+import numpy as np
+import lab3_raw as lraw
+import lab3_lazy as ll
+import hashlib, json, os, shutil, glob
+
+# Only imported once a DataFrame is made
+pd = ll.lazy_import('pandas')
+
+# Cache folder made next to each CSV, folder in it analysis results are kept
+    # in and size of blocks read for hashing
+CACHE_DIR = '.cache'
+RESULTS_DIR = 'results'
+HASH_BLOCK = 1 << 20
+
+def file_hash(filename):
+    """
+        Function to get SHA-1 hash of file contents, read in blocks so large
+            files are not loaded at once
+    """
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+def _load_index(cache_root):
+    # Index of CSV name to size, modified time and content hash
+    try:
+        with open(os.path.join(cache_root, 'index.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_index(cache_root, index):
+    tmp = os.path.join(cache_root, 'index.json.tmp%s' % os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(index, f, indent=4)
+    os.replace(tmp, os.path.join(cache_root, 'index.json'))
+
+def cache_key(filename, cache_root=None):
+    """
+        Function to get content hash of CSV used as its cache key. Hash is
+            only recomputed when file size or modified time have changed
+            since it was last stored
+
+        INPUTS
+        :filename: - CSV filename
+        :cache_root: - cache folder, defaults to CACHE_DIR next to CSV
+
+        OUTPUT
+        :key: - content hash of CSV
+    """
+    if cache_root is None:
+        cache_root = os.path.join(os.path.dirname(os.path.abspath(filename)), CACHE_DIR)
+    os.makedirs(cache_root, exist_ok=True)
+
+    name = os.path.basename(filename)
+    stat = os.stat(filename)
+    index = _load_index(cache_root)
+    entry = index.get(name, {})
+    if entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+        return entry['hash']
+
+    key = file_hash(filename)
+    old_key = entry.get('hash')
+    index[name] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': key}
+    _save_index(cache_root, index)
+
+    # Remove cache and results of old contents unless another CSV has the
+        # same contents
+    if old_key and old_key != key and \
+            not any(e['hash'] == old_key for e in index.values()):
+        shutil.rmtree(os.path.join(cache_root, old_key), ignore_errors=True)
+        for old in glob.glob(os.path.join(cache_root, RESULTS_DIR, old_key + '-*')):
+            os.remove(old)
+
+    return key
+
+def params_key(params):
+    """
+        Function to get short hash of analysis parameters, such as trigger
+            levels, so results found with other parameters are not reused
+
+        INPUT
+        :params: - JSON-able dict of parameter name to value
+    """
+    text = json.dumps(params, sort_keys=True, default=str)
+
+    return hashlib.sha1(text.encode()).hexdigest()[:12]
+
+def result_file(filename, params, ext='.json', cache_root=None):
+    """
+        Function to get filename analysis results of CSV are cached under.
+            Name is made from content hash of CSV and hash of :params:, so it
+            only exists when same contents were analyzed with same parameters
+
+        INPUTS
+        :filename: - CSV filename
+        :params: - JSON-able dict of analysis parameters
+        :ext: - extension of results file
+        :cache_root: - cache folder, defaults to CACHE_DIR next to CSV
+
+        OUTPUT
+        :result: - results filename, file may not exist yet
+    """
+    if cache_root is None:
+        cache_root = os.path.join(os.path.dirname(os.path.abspath(filename)), CACHE_DIR)
+    results = os.path.join(cache_root, RESULTS_DIR)
+    os.makedirs(results, exist_ok=True)
+
+    return os.path.join(results, '%s-%s%s' % (cache_key(filename, cache_root),
+                                                params_key(params), ext))
+
+def build_cache(filename, entry_dir):
+    """
+        Function to parse CSV once and write each column to its own .npy file
+            with list of column names in columns.json. Written to temporary
+            folder first so partly written caches are never read
+
+        INPUTS
+        :filename: - CSV filename to parse
+        :entry_dir: - folder to write cache entry to
+    """
+    df = pd.read_csv(filename)
+    tmp = entry_dir + '.tmp%s' % os.getpid()
+    os.makedirs(tmp, exist_ok=True)
+
+    for i, col in enumerate(list(df)):
+        # Any text left in column (such as a cut off last line) becomes NaN
+            # so column can be memory-mapped
+        values = pd.to_numeric(df[col], errors='coerce').values
+        np.save(os.path.join(tmp, '%s.npy' % i), np.ascontiguousarray(values))
+    with open(os.path.join(tmp, 'columns.json'), 'w') as f:
+        json.dump(list(df), f)
+
+    try:
+        os.rename(tmp, entry_dir)
+    except OSError:
+        # Another process cached same contents first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def load_columns(filename, cache_root=None):
+    """
+        Function to get columns of CSV as memory-mapped np.arrays, parsing the
+            CSV into the cache first if its contents have not been seen.
+            Binary SPICE raw files are memory-mapped directly instead
+
+        INPUTS
+        :filename: - CSV filename
+        :cache_root: - cache folder, defaults to CACHE_DIR next to CSV
+
+        OUTPUT
+        :columns: - dict of column name to read-only memory-mapped np.array,
+            in same order as CSV
+    """
+    if str(filename).lower().endswith(lraw.RAW_EXT):
+        return lraw.load_raw(filename)
+    if cache_root is None:
+        cache_root = os.path.join(os.path.dirname(os.path.abspath(filename)), CACHE_DIR)
+    entry_dir = os.path.join(cache_root, cache_key(filename, cache_root))
+    if not os.path.exists(os.path.join(entry_dir, 'columns.json')):
+        build_cache(filename, entry_dir)
+
+    with open(os.path.join(entry_dir, 'columns.json')) as f:
+        names = json.load(f)
+
+    return {col: np.load(os.path.join(entry_dir, '%s.npy' % i), mmap_mode='r')
+            for i, col in enumerate(names)}
+
+def read_csv_cached(filename, cache_root=None):
+    """
+        Function to use in place of pd.read_csv for simulation CSVs. Columns
+            are opened from cache without copying
+    """
+    return pd.DataFrame(load_columns(filename, cache_root), copy=False)
@@ -0,0 +1,86 @@
+import numpy as np
+
+# Bins used when axes size is not known yet, about one per pixel on a wide figure
+DEFAULT_BINS = 2000
+
+def minmax_decimate(x, y, n_bins, xlim=None):
+    """
+        Function to cut a trace down to a min/max envelope for plotting. The
+            x-range is split into bins, about one per pixel, and only the min
+            and max points of each bin are kept. Edges keep their shape at
+            any zoom since the extremes of every pixel column are drawn
+
+        INPUTS
+        :x: - sorted np.array of x-points
+        :y: - np.array of y-points
+        :n_bins: - number of bins to split x-range into
+        :xlim: - (left, right) x-range to decimate, whole trace if not given.
+            One point either side is kept so lines run to edge of view
+
+        OUTPUTS
+        :x_dec: - np.array of decimated x-points
+        :y_dec: - np.array of decimated y-points
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    start, stop = 0, len(x)
+    if xlim is not None:
+        start = max(np.searchsorted(x, xlim[0], side='left') - 1, 0)
+        stop = min(np.searchsorted(x, xlim[1], side='right') + 1, len(x))
+    x = x[start:stop]
+    y = y[start:stop]
+
+    # Nothing to gain when there are fewer points than min/max pairs
+    if len(x) <= 2 * n_bins:
+        return x, y
+
+    # Start of each non-empty bin of x-range
+    edges = np.linspace(x[0], x[-1], n_bins + 1)
+    starts = np.unique(np.searchsorted(x, edges[:-1], side='left'))
+    ends = np.append(starts[1:], len(x)) - 1
+
+    y_min = np.minimum.reduceat(y, starts)
+    y_max = np.maximum.reduceat(y, starts)
+
+    # Put min first in bins where trace is rising so edges draw the right way
+    rising = y[starts] <= y[ends]
+    x_dec = np.column_stack([x[starts], x[ends]]).ravel()
+    y_dec = np.column_stack([np.where(rising, y_min, y_max),
+                                np.where(rising, y_max, y_min)]).ravel()
+
+    return x_dec, y_dec
+
+def _axes_bins(ax):
+    # Number of pixels across axes, or DEFAULT_BINS before it is drawn
+    try:
+        width = int(ax.get_window_extent().width)
+    except Exception:
+        width = 0
+
+    return width if width > 1 else DEFAULT_BINS
+
+def plot_decimated(ax, x, y, *args, **kwargs):
+    """
+        Function to use in place of ax.plot for long traces. Plots min/max
+            envelope of trace and decimates again from full trace whenever
+            axes is zoomed or panned, so detail comes back when zooming in
+
+        INPUTS
+        :ax: - matplotlib axes to plot on
+        :x: - sorted np.array of x-points
+        :y: - np.array of y-points
+        :args, kwargs: - passed on to ax.plot
+
+        OUTPUT
+        :line: - matplotlib Line2D of plotted trace
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    line, = ax.plot(*minmax_decimate(x, y, _axes_bins(ax)), *args, **kwargs)
+
+    def redecimate(ax):
+        line.set_data(*minmax_decimate(x, y, _axes_bins(ax), ax.get_xlim()))
+
+    ax.callbacks.connect('xlim_changed', redecimate)
+
+    return line
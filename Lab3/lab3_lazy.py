@@ -0,0 +1,24 @@
+import importlib, types
+
+class LazyModule(types.ModuleType):
+    # Stand in for module that imports it on first attribute used, then
+        # keeps its attributes so later lookups go straight to them
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+
+        return getattr(module, attr)
+
+def lazy_import(name):
+    """
+        Function to get module that is only imported when one of its
+            attributes is first used, so scripts that never plot or build
+            DataFrames do not pay for importing matplotlib or pandas
+
+        INPUT
+        :name: - full module name, such as 'matplotlib.pyplot'
+
+        OUTPUT
+        :module: - LazyModule standing in for module
+    """
+    return LazyModule(name)
@@ -0,0 +1,167 @@
+from collections import deque
+import re, os
+
+# Netlist describing oscillator ring, and subcircuit ports taken as stage
+    # input and output
+NETLIST = os.path.join('data', 'netlist.txt')
+IN_PORT = 'in'
+OUT_PORT = 'out'
+
+# Instance statement such as "I0 (net1 net11) inv1 w=1.5u"
+INSTANCE = re.compile(r'^(\S+)\s*\(([^)]*)\)\s*(\S+)')
+
+def _statements(filename):
+    # Netlist statements with comments removed and continued lines joined
+    statements = []
+    line = ''
+    with open(filename) as f:
+        for raw in f:
+            raw = raw.split('//')[0].rstrip()
+            if raw.endswith('\\'):
+                line += raw[:-1] + ' '
+                continue
+            line = (line + raw).strip()
+            if line:
+                statements.append(line)
+            line = ''
+    if line.strip():
+        statements.append(line.strip())
+
+    return statements
+
+def parse_netlist(filename=NETLIST):
+    """
+        Function to read top level of Spectre netlist. Statements inside
+            subcircuit definitions are skipped, only subcircuit ports are kept
+
+        INPUT
+        :filename: - netlist filename
+
+        OUTPUT
+        :netlist: - dict with 'subckts' {cell: [ports]}, 'instances' list of
+            {'name', 'nodes', 'cell'} in netlist order and 'ic' {net: value}
+            of initial conditions
+    """
+    netlist = {'subckts': {}, 'instances': [], 'ic': {}}
+    subckt = None
+    for s in _statements(filename):
+        words = s.replace('(', ' ').replace(')', ' ').split()
+        if words[0] == 'subckt':
+            subckt = words[1]
+            netlist['subckts'][subckt] = words[2:]
+        elif words[0] == 'ends':
+            subckt = None
+        elif subckt is not None:
+            continue
+        elif words[0] == 'ic':
+            for w in words[1:]:
+                net, value = w.split('=')
+                netlist['ic'][net] = float(value)
+        else:
+            match = INSTANCE.match(s)
+            if match:
+                netlist['instances'].append({'name': match.group(1),
+                                            'nodes': match.group(2).split(),
+                                            'cell': match.group(3)})
+
+    return netlist
+
+def netlist_stages(netlist):
+    """
+        Function to get stages of netlist as input and output nets. Instances
+            of subcircuits with IN_PORT and OUT_PORT ports use those, other
+            two node instances are taken as (in out)
+
+        OUTPUT
+        :stages: - list of {'name', 'cell', 'in', 'out'} dicts
+    """
+    stages = []
+    for inst in netlist['instances']:
+        nodes = inst['nodes']
+        ports = netlist['subckts'].get(inst['cell'], [])
+        if IN_PORT in ports and OUT_PORT in ports and len(ports) == len(nodes):
+            net_in, net_out = nodes[ports.index(IN_PORT)], nodes[ports.index(OUT_PORT)]
+        elif len(nodes) == 2:
+            net_in, net_out = nodes
+        else:
+            continue
+        stages.append({'name': inst['name'], 'cell': inst['cell'],
+                        'in': net_in, 'out': net_out})
+
+    return stages
+
+def signal_order(stages, start=None):
+    """
+        Function to order nets along signal path, each net coming after the
+            net driving it. Path is walked breadth first from :start:, so a
+            ring comes out in ring order and branches follow their driver
+
+        INPUTS
+        :stages: - netlist_stages output
+        :start: - net to start from, net not driven by any stage (path
+            input) or input of first stage if not given
+
+        OUTPUT
+        :order: - list of (net, driver net) tuples, driver is None for a
+            net no stage drives
+    """
+    fanout = {}
+    driver = {}
+    for stage in stages:
+        fanout.setdefault(stage['in'], []).append(stage['out'])
+        driver[stage['out']] = stage['in']
+    if start is None:
+        inputs = [stage['in'] for stage in stages if stage['in'] not in driver]
+        start = inputs[0] if inputs else stages[0]['in']
+
+    order = []
+    seen = {start}
+    queue = deque([start])
+    while queue:
+        net = queue.popleft()
+        order.append((net, driver.get(net)))
+        for out in fanout.get(net, []):
+            if out not in seen:
+                seen.add(out)
+                queue.append(out)
+
+    return order
+
+def net_column(net):
+    # CSV column name simulator gives voltage of net
+    return '%s (V)' % net
+
+def netlist_order(filename=NETLIST, start=None):
+    """
+        Function to get signal path order of nets in netlist, starting from
+            first net given an initial condition (where ring is kicked off)
+            if :start: is not given
+    """
+    netlist = parse_netlist(filename)
+    if start is None and netlist['ic']:
+        start = list(netlist['ic'])[0]
+
+    return signal_order(netlist_stages(netlist), start)
+
+def column_order(columns, filename=NETLIST, start=None):
+    """
+        Function to order CSV columns along signal path of netlist
+
+        INPUTS
+        :columns: - CSV column names
+        :filename: - netlist filename
+        :start: - net to start from, see netlist_order
+
+        OUTPUT
+        :order: - list of (column, driver column) tuples for nets found in
+            :columns:, driver is None when it is not in :columns:
+    """
+    columns = set(columns)
+    order = []
+    for net, driver in netlist_order(filename, start):
+        if net_column(net) in columns:
+            order.append((net_column(net), net_column(driver)
+                            if driver is not None and net_column(driver) in columns
+                            else None))
+
+    return order
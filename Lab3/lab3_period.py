@@ -0,0 +1,141 @@
+import numpy as np
+import lab3_processing as lp
+import lab3_resample as lr
+import lab3_lazy as ll
+
+# Only imported once a DataFrame is made or a spectrum is taken
+pd = ll.lazy_import('pandas')
+signal = ll.lazy_import('scipy.signal')
+
+# Samples in uniform grid traces are put on for spectral methods, and factor
+    # FFT is zero padded by to refine frequency bins
+GRID_POINTS = 1 << 16
+ZERO_PAD = 8
+
+def _group_stats(values, groups, n):
+    # Count, mean and standard deviation of values per group id, no loops
+    count = np.bincount(groups, minlength=n)
+    total = np.bincount(groups, weights=values, minlength=n)
+    total_sq = np.bincount(groups, weights=values**2, minlength=n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / count
+        std = np.sqrt(np.maximum(total_sq / count - mean**2, 0))
+
+    return count, mean, std
+
+def edge_periods(records, edge='rise'):
+    """
+        Function to get period, frequency and jitter of every net from its
+            edge timestamps. Edges of all nets are joined into one array so
+            periods and their statistics are found in a few array operations
+            however many cycles there are
+
+        INPUTS
+        :records: - dict of processed data, nets without edges are skipped
+        :edge: - 'rise' or 'fall' for which 50% edge times periods are
+            measured between
+
+        OUTPUT
+        :periods: - pd.DataFrame indexed by net with 'cycles', 'period',
+            'frequency', 'period_min', 'period_max', 'jitter_rms' (standard
+            deviation of periods) and 'jitter_c2c' (rms change between
+            consecutive periods) columns, times in seconds
+    """
+    nets = [net for net in records if '%s_edges' % edge in records[net]]
+    ts = [lp.half_times(records[net], edge, None) for net in nets]
+    n = len(nets)
+
+    # Periods between neighbouring edges of same net only
+    ids = np.repeat(np.arange(n), [len(t) for t in ts])
+    ts = np.concatenate(ts) if n else np.array([])
+    same = ids[1:] == ids[:-1]
+    period = np.diff(ts)[same]
+    pid = ids[1:][same]
+    cycles, mean, std = _group_stats(period, pid, n)
+
+    # Change between neighbouring periods of same net
+    same = pid[1:] == pid[:-1]
+    change = np.diff(period)[same]
+    _, c2c_ms, _ = _group_stats(change**2, pid[1:][same], n)
+
+    # Periods are grouped by net in order, so min and max reduce over slices
+    period_min = np.full(n, np.nan)
+    period_max = np.full(n, np.nan)
+    starts = np.flatnonzero(np.r_[True, pid[1:] != pid[:-1]]) if len(pid) else []
+    if len(starts):
+        period_min[pid[starts]] = np.minimum.reduceat(period, starts)
+        period_max[pid[starts]] = np.maximum.reduceat(period, starts)
+
+    return pd.DataFrame({'cycles': cycles, 'period': mean, 'frequency': 1 / mean,
+                        'period_min': period_min, 'period_max': period_max,
+                        'jitter_rms': std, 'jitter_c2c': np.sqrt(c2c_ms)},
+                        index=pd.Index(nets, name='net'))
+
+def _refine_peak(y, k):
+    # Fractional peak position from parabola through peak and neighbours
+    rows = np.arange(y.shape[0])
+    k = np.clip(k, 1, y.shape[1] - 2)
+    a, b, c = y[rows, k - 1], y[rows, k], y[rows, k + 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shift = np.nan_to_num(0.5 * (a - c) / (a - 2 * b + c))
+
+    return k + np.clip(shift, -0.5, 0.5)
+
+def spectral_periods(df, nets=None, method='fft', points=GRID_POINTS):
+    """
+        Function to get period and frequency of every net from whole trace
+            instead of single edges. All nets are put on one uniform grid then
+            worked on as one 2-D array
+
+        INPUTS
+        :df: - pd.DataFrame of simulation with TIME_COL column
+        :nets: - list of net columns, all but TIME_COL if not given
+        :method: - 'fft' for peak of periodogram or 'autocorr' for first peak
+            of autocorrelation after it first goes negative. Nets with no
+            such peak get NaN period
+        :points: - number of points in uniform grid
+
+        OUTPUT
+        :periods: - pd.DataFrame indexed by net with 'period' and
+            'frequency' columns
+    """
+    if nets is None:
+        nets = [net for net in df if net != lp.TIME_COL]
+    time = df[lp.TIME_COL].values
+    grid = lr.uniform_grid(time, points=points)
+    values = lr.resample_values(time, np.stack([df[net].values for net in nets], axis=1),
+                                grid).T
+    dt = grid[1] - grid[0]
+
+    if method == 'fft':
+        nfft = ZERO_PAD * points
+        freqs, power = signal.periodogram(values, fs=1 / dt, window='hann',
+                                            nfft=nfft, detrend='constant', axis=-1)
+        power[:, 0] = 0
+        peak = _refine_peak(power, np.argmax(power, axis=1))
+        frequency = peak * (freqs[1] - freqs[0])
+        period = 1 / frequency
+    elif method == 'autocorr':
+        # Autocorrelation of every net at once through zero padded FFT
+        values = values - values.mean(axis=1, keepdims=True)
+        spectrum = np.fft.rfft(values, n=2 * points, axis=1)
+        ac = np.fft.irfft(np.abs(spectrum)**2, axis=1)[:, :points]
+        # First peak is between where autocorrelation first goes positive
+            # again after going negative and where it next goes negative
+        lags = np.arange(points)
+        neg = ac < 0
+        first_neg = np.argmax(neg, axis=1)[:, None]
+        first_pos = np.argmax(~neg & (lags > first_neg), axis=1)[:, None]
+        next_neg = lags >= first_pos
+        next_neg = np.where(np.any(neg & next_neg, axis=1),
+                            np.argmax(neg & next_neg, axis=1), points)[:, None]
+        window = (lags >= first_pos) & (lags < next_neg)
+        found = (first_neg[:, 0] > 0) & (first_pos[:, 0] > first_neg[:, 0])
+        peak = _refine_peak(ac, np.argmax(np.where(window, ac, -np.inf), axis=1))
+        period = np.where(found, peak * dt, np.nan)
+        frequency = 1 / period
+    else:
+        raise ValueError("method must be 'fft' or 'autocorr', not %s" % method)
+
+    return pd.DataFrame({'period': period, 'frequency': frequency},
+                        index=pd.Index(nets, name='net'))
@@ -1,123 +1,324 @@
-import json, os
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy import signal
 
 TIME_COL = 'time (s)'
 TOP_TRIGGER = 0.8 # Calculate rise/fall times 20%-80%
 BOT_TRIGGER = 0.2
 HALF_TRIGGER = 0.5 # 50%
 
-def remove_unpaired(data):
+# Edge start, 50% and end crossing indicies and times
+EDGE_DTYPE = np.dtype([('start', np.int64), ('mid', np.int64), ('end', np.int64),
+                        ('start_ts', np.float64), ('mid_ts', np.float64), 
+                        ('end_ts', np.float64)])
+
+def find_crossings(points, levels, time, block=None):
     """
-        Function to remove unpaied rising or falling points.
-            For instance, if rising points are to be found and a top
-            intersection does not have a bottom intersection before it,
-            the top is filtered out to create a top and bot pair of 
-            same length
-            
-        INPUT
-        :data: - dictionary of lists where keys are 'top' and 'bot' for top
-            and bottom indicies
+        Function to find where a trace crosses several threshold levels in
+            a single pass over the points. Each sample is put in a band
+            between the sorted levels, so only samples where the band
+            changes need to be looked at for each level
             
+        INPUTS
+        :points: - np.array of y-points for trace
+        :levels: - list of threshold values to find crossings for
+        :time: - np.array of x-points for trace
+        :block: - number of points banded at a time, bounds working memory
+            to a few arrays of this length. Whole trace at once if not given
+        
+        OUTPUTS
+        :inds: - list of np.arrays, one per level, of indicies just before
+            each crossing (same as np.argwhere(np.diff(np.sign(...))))
+        :ts: - list of np.arrays, one per level, of crossing times linearly
+            interpolated between the samples on either side of the crossing
+    """
+    points = np.asarray(points)
+    levels = np.asarray(levels, dtype=float)
+    order = np.argsort(levels)
+    if not block:
+        block = max(len(points), 1)
+    
+    # Band is number of levels at or below each point, blocks overlap by one
+        # point so band changes across block boundaries are kept
+    changed, lo, hi = [], [], []
+    for start in range(0, max(len(points) - 1, 1), block):
+        band = np.searchsorted(levels[order], points[start:start + block + 1],
+                                side='right')
+        c = np.flatnonzero(band[1:] != band[:-1])
+        changed.append(c + start)
+        lo.append(band[c])
+        hi.append(band[c + 1])
+    changed = np.concatenate(changed)
+    lo = np.concatenate(lo)
+    hi = np.concatenate(hi)
+    
+    inds = [None] * len(levels)
+    ts = [None] * len(levels)
+    for j, k in enumerate(order):
+        # Level j is crossed when it is between the bands on either side
+        ind = changed[(lo > j) != (hi > j)]
+        inds[k] = ind
+        ts[k] = interp_crossings(points, time, ind, levels[k])
+        
+    return inds, ts
+    
+def interp_crossings(points, time, inds, level):
+    """
+        Function to linearly interpolate crossing times of a level
+        
+        INPUTS
+        :points: - np.array of y-points for trace
+        :time: - np.array of x-points for trace
+        :inds: - np.array of indicies just before each crossing of level
+        :level: - threshold value crossed
+        
         OUTPUT
-        :data: - :data: input with filtered out unpaired indicies
-    """
-    # If top and bot points are of equal amount it is known that if
-        # a point must be filtered out from one aspect, a point must
-        # be filtered out from the other end of the other aspect
-    if len(data['top']) == len(data['bot']):
-        if data['top'][1] < data['bot'][0]:
-            data['top'] = data['top'][1:]
-            data['bot'] = data['bot'][:-1]
-            
-        elif data['top'][0] > data['bot'][1]:
-            data['bot'] = data['bot'][1:]
-            data['top'] = data['top'][:-1]
-    # If not equal in length, must do processing differently
-    else:
-        # Checks if one bound has 2 extra points than the other
-            # If this is true, first and last point will be filtered
-            # out of mismatched bound
-        bothSides = False
-        if abs(len(data['top'])-len(data['bot']))==2:
-            bothSides=True
-            
-        # Checks if there is an extra top point in beginning
-        if data['top'][1] < data['bot'][0]:
-            data['top'] = data['top'][1:]
-            if bothSides:
-                data['top'] = data['top'][:-1]
+        :ts: - np.array of interpolated crossing times
+    """
+    inds = np.asarray(inds, dtype=int)
+    # Stored values such as int16 codes would overflow when subtracted
+    p0 = points[inds].astype(float)
+    p1 = points[inds + 1].astype(float)
+    t0 = time[inds]
+    
+    return t0 + (level - p0) / (p1 - p0) * (time[inds + 1] - t0)
+    
+def crossing_times(data, key, inds, time):
+    """
+        Function to get times for crossing indicies of a record. Uses the
+            interpolated times kept in data[key + '_ts'] if found, otherwise
+            times are taken straight from timescale
             
-        # Checks if there is an extra bot point in beginning
-        elif data['top'][0] > data['bot'][1]:
-            data['bot'] = data['bot'][1:]
-            if bothSides:
-                data['bot'] = data['bot'][:-1]
+        INPUTS
+        :data: - dictionary of crossing indicies, such as 'top', 'bot', 'half'
+        :key: - crossing key that :inds: come from
+        :inds: - np.array of crossing indicies to get times for
+        :time: - timescale to fall back on
+        
+        OUTPUT
+        :ts: - np.array of times for :inds:
+    """
+    inds = np.asarray(inds, dtype=int)
+    if key + '_ts' not in data:
+        return time[inds]
+        
+    return np.asarray(data[key + '_ts'])[np.searchsorted(data[key], inds)]
 
-    return data
-    
 def clear_range(top_ind, bot_ind, half_ind):
     """
         Function to fix bug where np.argwhere returns two indicies
-            where there should only be one
+            where there should only be one. In any run of back to back
+            indicies every other index is removed, starting with the second
     """
     eval = [top_ind, bot_ind, half_ind]
     for i in range(len(eval)):
-        for j in eval[i]:
-            if j-1 in eval[i]:
-                eval[i] = np.delete(eval[i], np.where(eval[i]==j))
+        ind = np.asarray(eval[i])
+        if len(ind) < 2:
+            continue
+        # Position of each index within its run of back to back indicies
+        starts = np.flatnonzero(np.diff(ind) != 1) + 1
+        run_start = np.zeros(len(ind), dtype=int)
+        run_start[starts] = starts
+        pos = np.arange(len(ind)) - np.maximum.accumulate(run_start)
+        eval[i] = ind[pos % 2 == 0]
                 
     return eval
     
+def hysteresis_levels(levels, hysteresis):
+    """
+        Function to get levels to find crossings for when debouncing with
+            hysteresis band around each level
+            
+        INPUTS
+        :levels: - list of threshold values
+        :hysteresis: - half width of band around each level
+        
+        OUTPUT
+        :band_levels: - list of [level - hysteresis, level, level + hysteresis]
+            for each level, flattened, to pass to find_crossings
+    """
+    band_levels = []
+    for level in levels:
+        band_levels.extend([level - hysteresis, level, level + hysteresis])
+        
+    return band_levels
+    
+def debounce_crossings(inds, ts, band_levels, start, min_dwell=0):
+    """
+        Function to suppress noisy multiple crossings of levels. Works like
+            a Schmitt trigger, a rise only counts once the trace goes above the
+            top of the hysteresis band and a fall once it goes below the
+            bottom. Each counted edge is put at the last crossing of the level
+            itself before that. An edge cut off by the end of the trace is
+            kept if it has crossed the level. Only the crossings are worked
+            on, not the trace, so this is linear in the number of crossings
+            
+        INPUTS
+        :inds: - list of crossing indicies from find_crossings run on
+            hysteresis_levels output
+        :ts: - list of crossing times from same find_crossings call
+        :band_levels: - hysteresis_levels output
+        :start: - first point of trace, used to tell which way first
+            crossing of each level goes
+        :min_dwell: - edges leaving trace at a level for less time than this
+            are removed as glitches. Runs of short levels keep last edge if
+            there is an odd number of edges so that edges still alternate
+            
+        OUTPUTS
+        :inds: - list of debounced crossing indicies, one per level
+        :ts: - list of debounced crossing times, one per level
+    """
+    out_inds = []
+    out_ts = []
+    for k in range(0, len(band_levels), 3):
+        lower, level, upper = band_levels[k:k+3]
+        lo_ind, mid_ind, hi_ind = inds[k:k+3]
+        
+        # Crossings of one level alternate direction, first one is rising
+            # if trace starts below level
+        up = np.asarray(hi_ind)[(0 if start < upper else 1)::2]
+        down = np.asarray(lo_ind)[(1 if start < lower else 0)::2]
+        
+        # Merge rising crossings of upper and falling crossings of lower in
+            # order, only changes in state are kept
+        ev = np.concatenate([up, down])
+        rising = np.concatenate([np.ones(len(up), dtype=bool), 
+                                np.zeros(len(down), dtype=bool)])
+        order = np.argsort(ev, kind='stable')
+        ev = ev[order]
+        rising = rising[order]
+        prev = np.concatenate([[start >= level], rising[:-1]])
+        changed = rising != prev
+        ev = ev[changed]
+        
+        # Last crossing of level at or before each state change is the edge
+        pos = np.searchsorted(mid_ind, ev, side='right') - 1
+        pos = pos[pos >= 0]
+        
+        # Keep last crossing of level if trace ends before it gets through
+            # band, as long as it goes the other way from last state
+        state = rising[changed][-1] if len(ev) else start >= level
+        last = len(mid_ind) - 1
+        last_rising = (last % 2 == 0) == (start < level)
+        if last >= 0 and last_rising != state and (not len(pos) or pos[-1] < last):
+            pos = np.append(pos, last)
+        edge_inds = np.asarray(mid_ind)[pos]
+        edge_ts = np.asarray(ts[k+1])[pos]
+        
+        if min_dwell > 0 and len(edge_ts) > 1:
+            keep = _dwell_mask(edge_ts, min_dwell)
+            edge_inds = edge_inds[keep]
+            edge_ts = edge_ts[keep]
+            
+        out_inds.append(edge_inds)
+        out_ts.append(edge_ts)
+        
+    return out_inds, out_ts
+    
+def _dwell_mask(edge_ts, min_dwell):
+    # Mask of edges to keep after removing levels held for under min_dwell
+    short = np.diff(edge_ts) < min_dwell
+    in_run = np.zeros(len(edge_ts), dtype=bool)
+    in_run[:-1] |= short
+    in_run[1:] |= short
+    if not in_run.any():
+        return ~in_run
+        
+    # Label runs of edges joined by short levels, then get position and
+        # length of each edge's run
+    run_start = in_run & ~np.concatenate([[False], short])
+    run_id = np.cumsum(run_start) - 1
+    first = np.flatnonzero(run_start)
+    run_len = np.bincount(run_id[in_run])
+    pos = np.arange(len(edge_ts)) - first[run_id]
+    
+    drop = np.zeros(len(edge_ts), dtype=bool)
+    drop[in_run] = pos[in_run] < (run_len - run_len % 2)[run_id[in_run]]
+    
+    return ~drop
+    
+def pair_edges(data, time=None):
+    """
+        Function to pair top, bot and half crossings into complete rising and
+            falling edges. All crossings are merged in time order, a rising
+            edge is a bot crossing followed straight away by half then top
+            crossings and a falling edge is the reverse. Partial edges from
+            glitches or the ends of the trace match neither and drop out
+            
+        INPUTS
+        :data: - dictionary of crossing indicies with 'top', 'bot' and 'half'
+            keys. Interpolated times are taken from 'top_ts', 'bot_ts' and
+            'half_ts' if found
+        :time: - timescale for crossing times if not in :data:
+            
+        OUTPUTS
+        :rise: - EDGE_DTYPE np.array of rising edges, start at bot crossing
+            and end at top crossing
+        :fall: - EDGE_DTYPE np.array of falling edges, start at top crossing
+            and end at bot crossing
+    """
+    try:
+        keys = ('bot', 'half', 'top')
+        inds = [np.asarray(data[k], dtype=np.int64) for k in keys]
+    except KeyError as e: # Raises error if data is not formatted correctly
+        raise KeyError('\'top\', \'bot\' and \'half\' keys required in data input')
+    ts = [crossing_times(data, k, inds[j], time) for j, k in enumerate(keys)]
+    
+    # Merge crossings in time order, each list is already sorted so stable
+        # sort only has to merge them
+    kind = np.concatenate([np.full(len(ind), j, dtype=np.int8) for j, ind in enumerate(inds)])
+    ind = np.concatenate(inds)
+    t = np.concatenate(ts)
+    order = np.argsort(t, kind='stable')
+    kind = kind[order]
+    ind = ind[order]
+    t = t[order]
+    
+    # Look at every 3 crossings in a row for bot-half-top or top-half-bot
+    first, mid, last = kind[:-2], kind[1:-1], kind[2:]
+    rising = (first == 0) & (mid == 1) & (last == 2)
+    falling = (first == 2) & (mid == 1) & (last == 0)
+    
+    edges = []
+    for mask in (rising, falling):
+        pos = np.flatnonzero(mask)
+        edge = np.empty(len(pos), dtype=EDGE_DTYPE)
+        for j, field in enumerate(('start', 'mid', 'end')):
+            edge[field] = ind[pos + j]
+            edge[field + '_ts'] = t[pos + j]
+        edges.append(edge)
+        
+    return edges[0], edges[1]
+    
 def get_risefall_inds(data):
     """
         Function to get rise and fall point indicies from input data
         
         INPUT
-        :data: - dictionary of lists where keys are 'top' and 'bot' for top
-            and bottom indicies that has been processed by removed_unpaired
-            
+        :data: - dictionary of lists where keys are 'top', 'bot' and 'half'
+            for top, bottom and halfway indicies
+        
         OUTPUTS
         :rise: - np.array of index points associated with rise in waveform
         :fall: - np.array of index points associated with fall in waveform
+        :rise_half: - np.array of halfway indicies of rises
+        :fall_half: - np.array of halfway indicies of falls
         
         NOTE: Rise and fall outputs are with orientation of...
             [top x-index, bot x-index]
     """
-    try:
-        # Zips top and bot lists so top, bot indicies are paired into Nx2 array
-        temp = zip(data['top'], data['bot'])
-    except KeyError as e: # Raises error if data is not formatted correctly
-        raise KeyError('\'top\' and \'bot\' keys required in data input')
-    
-    # Init lists for rise and fall coords
-    rise = []
-    fall = []
-    rise_half = []
-    fall_half = []
-    
-    # Iterate through top, bot pairs
-    for i, t in enumerate(temp):
-        # If top index is before bottom, it is a rise event
-        if t[0] > t[1]:
-            rise.append(t)
-            rise_half.append(data['half'][i])
-        else: # Otherwise it is a fall event
-            fall.append(t)
-            fall_half.append(data['half'][i])
-            
-    # Return as numpy arrays
-    return np.array(rise), np.array(fall), np.array(rise_half), np.array(fall_half)
+    rise, fall = pair_edges(data)
+    
+    return (np.column_stack([rise['end'], rise['start']]), 
+            np.column_stack([fall['start'], fall['end']]), 
+            rise['mid'], fall['mid'])
     
 def calc_riseFall_times(index_dict, time):
     """
         Function to get rise and fall times for input indicies
         
         INPUT
-        :index_dict: - dictionary of lists where keys are 'rise' and 'fall' for top
-            and bottom indicies that has been processed by get_risefall_inds
+        :index_dict: - dictionary with 'rise_edges' and 'fall_edges' from
+            pair_edges, or with lists where keys are 'rise' and 'fall' for
+            top and bottom indicies from get_risefall_inds
         :time: - timescale for times to be calculated from based off index_dict
             indicies
             
@@ -125,17 +326,63 @@ def calc_riseFall_times(index_dict, time):
         :rise_ts: - list of rise times
         :fall_ts: - list of fall times
     """
-    rise = index_dict['rise']
-    fall = index_dict['fall']
+    if 'rise_edges' in index_dict and 'fall_edges' in index_dict:
+        rise = index_dict['rise_edges']
+        fall = index_dict['fall_edges']
+        return rise['end_ts'] - rise['start_ts'], fall['end_ts'] - fall['start_ts']
+        
+    rise = np.asarray(index_dict['rise'], dtype=int).reshape(-1, 2)
+    fall = np.asarray(index_dict['fall'], dtype=int).reshape(-1, 2)
 
     # Get timesets then subtract...
         # top-bot for rise
         # bot-top for fall
-    rise_ts = np.array([np.sum(time[r]*[1, -1]) for r in rise])
-    fall_ts = np.array([np.sum(time[f]*[-1, 1]) for f in fall])
+    rise_ts = (crossing_times(index_dict, 'top', rise[:, 0], time) - 
+                crossing_times(index_dict, 'bot', rise[:, 1], time))
+    fall_ts = (crossing_times(index_dict, 'bot', fall[:, 1], time) - 
+                crossing_times(index_dict, 'top', fall[:, 0], time))
 
     return rise_ts, fall_ts
     
+def half_times(data, edge, time):
+    """
+        Function to get 50% crossing times of rising or falling edges
+        
+        INPUTS
+        :data: - records entry with edge key, such as 'rise_edges', or half
+            indicies, such as 'rise_half'
+        :edge: - 'rise' or 'fall'
+        :time: - timescale to fall back on if crossing times not in :data:
+        
+        OUTPUT
+        :ts: - np.array of 50% times of edges
+    """
+    if edge + '_edges' in data:
+        return data[edge + '_edges']['mid_ts']
+        
+    return crossing_times(data, 'half', data[edge + '_half'], time)
+    
+def match_edges(out_ts, in_ts):
+    """
+        Function to match each output edge to the input edge causing it, taken
+            as the latest input edge at or before the output edge
+            
+        INPUTS
+        :out_ts: - sorted np.array of output edge times
+        :in_ts: - sorted np.array of input edge times
+        
+        OUTPUT
+        :delays: - np.array of delay from matched input edge to each output
+            edge. Output edges before first input edge have no match and
+            are left out
+    """
+    in_ts = np.asarray(in_ts)
+    out_ts = np.asarray(out_ts)
+    pos = np.searchsorted(in_ts, out_ts, side='right') - 1
+    matched = pos >= 0
+    
+    return out_ts[matched] - in_ts[pos[matched]]
+    
 def osc_prop_time(input_node, time):
     """
         Function to calculate rise and fall propagation times of specified wave
@@ -146,84 +393,68 @@ def osc_prop_time(input_node, time):
         :time: - timescale to be referenced for time differences
         
         OUTPUTS
-        :rise_prop_ts: - propagation rise time for node
-        :fall_prop_ts: - propagation fall time for node
+        :rise_prop_ts: - propagation rise time for node, each rising edge from
+            falling edge before it
+        :fall_prop_ts: - propagation fall time for node, each falling edge from
+            rising edge before it
         :prop_ts: - average propagation time
     """
-    # Transfer data from input dictionary to temp so input is not changed by reference
-    node = {}; node.update(input_node)
-    
-    rise_prop_ts = []
-    fall_prop_ts = []
+    rise_half_ts = half_times(input_node, 'rise', time)
+    fall_half_ts = half_times(input_node, 'fall', time)
     
-    # Iterate through falling edges
-    for i, fallIndex in enumerate(node['fall_half']):
-        # Subtract first falling edge time from first rising edge time
-        fall_prop_ts.append(time[fallIndex] - time[node['rise_half'][i]])
-        
-        try:
-            # Try to subtract next rising edge time by current falling edge time
-            rise_prop_ts.append(time[node['rise_half'][i+1]] - time[fallIndex])
-        except:
-            pass
+    rise_prop_ts = match_edges(rise_half_ts, fall_half_ts)
+    fall_prop_ts = match_edges(fall_half_ts, rise_half_ts)
             
     # Get averate propagation delay
-    prop_ts = np.mean(list(rise_prop_ts) + list(fall_prop_ts))
+    prop_ts = np.mean(np.concatenate([rise_prop_ts, fall_prop_ts]))
     
-    return np.array(rise_prop_ts), np.array(fall_prop_ts), prop_ts
+    return rise_prop_ts, fall_prop_ts, prop_ts
     
-def calc_prop_times(node, source, time):
+def calc_prop_times(node, source, time, inverting=None):
     """
         Function to calculate rise and fall propagation times of specified input
-            node against all other node waveforms
+            node against all other node waveforms. Each edge of node is matched
+            to the latest edge of source before it with the causing polarity,
+            so it does not matter which edge either trace starts on
         
         INPUTS
         :node: - current curve to evaluate against input curve
         :source: - input curve
         :time: - timescale to be referenced for time differences
+        :inverting: - True if node rises from source falling (odd number of
+            inverters between them), False if node follows source. If not given
+            polarity with shorter median delay is used
         
         OUTPUTS
         :rise_prop_ts: - propagation rise time for node
         :fall_prop_ts: - propagation fall time for node
+        :prop_ts: - average propagation time
     """
-    node1 = {}; node1.update(node)
-    source1 = {}; source1.update(source)
-    
-    # Check that first half point on current node is for rising edge
-        # First point for input edge will always be on rise, so
-        # these calculations will only work out for current traces
-        # where the current node's first half point is on falling edge
-    nodePoints = list(node1['rise_half']) + list(node1['fall_half'])
-    
-    if not min(nodePoints) in node1['fall_half']:
-        return "[Cannot compute]", "[Cannot compute]", "[Cannot compute]"
-        
-    # First rise half of input curve (source) should be
-        # before the first fall half of current node
-        # If this is found to not be the case, remove first
-        # fall half of current node
-    if node1['fall_half'][0] < source1['rise_half'][0]:
-        node1['fall_half'] = node1['fall_half'][1:]
-        
-    # Get propagation delay for rising by iterating through current trace
-        # 50% points on rising edges. Current trace is used because this
-        # trace will always have as many or less points than the input
-        # trace so there won't be any index errors when indexing the
-        # input trace falling edge points
-    rise_prop_ts = []
-    for i, riseIndex in enumerate(node1['rise_half']):
-        rise_prop_ts.append(time[riseIndex] - time[source1['fall_half'][i]])
-        
-    # Get propagation delay for falling with same but opposite methodology
-        # as used for rise prop.
-    fall_prop_ts = []
-    for i, fallIndex in enumerate(node1['fall_half']):
-        fall_prop_ts.append(time[fallIndex] - time[source1['rise_half'][i]])
+    node_rise_ts = half_times(node, 'rise', time)
+    node_fall_ts = half_times(node, 'fall', time)
+    source_rise_ts = half_times(source, 'rise', time)
+    source_fall_ts = half_times(source, 'fall', time)
+    
+    # Rising output comes from falling input when inverting
+    delays = {}
+    for polarity in (True, False):
+        if inverting is not None and polarity != inverting:
+            continue
+        rise_src, fall_src = ((source_fall_ts, source_rise_ts) if polarity else 
+                                (source_rise_ts, source_fall_ts))
+        delays[polarity] = (match_edges(node_rise_ts, rise_src), 
+                            match_edges(node_fall_ts, fall_src))
+    
+    # Shorter delays are from the input edges actually causing node edges
+    def median_delay(polarity):
+        all_ts = np.concatenate(delays[polarity])
+        return np.median(all_ts) if len(all_ts) else np.inf
+    rise_prop_ts, fall_prop_ts = delays[min(delays, key=median_delay)]
         
     # Get averate propagation delay
-    prop_ts = np.mean(list(rise_prop_ts) + list(fall_prop_ts))
+    prop_ts = np.mean(np.concatenate([rise_prop_ts, fall_prop_ts]))
     
-    return np.array(rise_prop_ts), np.array(fall_prop_ts), prop_ts
+    return rise_prop_ts, fall_prop_ts, prop_ts
     
 def arrays_to_strings(records):
     """
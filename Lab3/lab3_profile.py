@@ -0,0 +1,108 @@
+import numpy as np
+from contextlib import contextmanager
+import json, time, tracemalloc
+import lab3_lazy as ll
+
+# Only imported once a DataFrame is made
+pd = ll.lazy_import('pandas')
+
+# Profile report format name written into saved JSON reports
+PROFILE_FORMAT = 'lab3_profile'
+
+class Profiler:
+    """
+        Records wall time, number of samples and peak memory of each stage
+            of a run, for each net where stage is done per net. Peak memory
+            is traced with tracemalloc (numpy arrays included) only when
+            :memory: is set, since tracing slows the run down
+
+        USE
+        prof = Profiler()
+        with prof.stage('crossings', net='net1 (V)', samples=len(points)):
+            ...
+        prof.save('profile.json')
+    """
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.entries = []
+        self._open = []
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name, net=None, samples=None):
+        entry = {'stage': name, 'net': net, 'samples': samples,
+                    'wall_s': 0.0, 'peak_mb': np.nan}
+        if self.memory:
+            # Peak reached so far belongs to enclosing stage, kept before
+                # reset_peak clears it
+            start_mem, outer_peak = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        # Highest peak cleared by stages inside this one
+        entry['_inner_peak'] = 0
+        self._open.append(entry)
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry['wall_s'] = time.perf_counter() - start
+            self._open.pop()
+            if self.memory:
+                peak = max(tracemalloc.get_traced_memory()[1], entry['_inner_peak'])
+                entry['peak_mb'] = (peak - start_mem) / 2**20
+                if self._open:
+                    self._open[-1]['_inner_peak'] = max(self._open[-1]['_inner_peak'],
+                                                        outer_peak, peak)
+            del entry['_inner_peak']
+            self.entries.append(entry)
+
+    def report(self):
+        """
+            Function to get every recorded stage as pd.DataFrame with 'stage',
+                'net', 'samples', 'wall_s' and 'peak_mb' (above memory at
+                stage start) columns, in order stages finished
+        """
+        report = pd.DataFrame(self.entries, columns=['stage', 'net', 'samples',
+                                                    'wall_s', 'peak_mb'])
+        report['samples'] = report['samples'].astype('Int64')
+
+        return report
+
+    def totals(self):
+        """
+            Function to get total wall time, samples and largest peak memory
+                of each stage over all nets
+        """
+        return self.report().groupby('stage', sort=False).agg(
+                    calls=('wall_s', 'size'), samples=('samples', 'sum'),
+                    wall_s=('wall_s', 'sum'), peak_mb=('peak_mb', 'max'))
+
+    def save(self, filename):
+        """
+            Function to write profile report, as CSV if :filename: ends in .csv
+                otherwise as JSON with per stage totals included
+        """
+        if str(filename).lower().endswith('.csv'):
+            self.report().to_csv(filename, index=False)
+            return filename
+
+        # Missing values written as null
+        report = self.report().astype(object)
+        report = report.where(report.notna(), None)
+        totals = self.totals().astype(object)
+        totals = totals.where(totals.notna(), None)
+        with open(filename, 'w') as f:
+            json.dump({'format': PROFILE_FORMAT, 'memory': self.memory,
+                        'stages': report.to_dict('records'),
+                        'totals': totals.to_dict('index')}, f, indent=4,
+                        default=lambda v: v.item() if hasattr(v, 'item') else str(v))
+
+        return filename
+
+class NullProfiler:
+    # Stand in when no profiling is wanted, stages cost nothing
+    @contextmanager
+    def stage(self, name, net=None, samples=None):
+        yield {}
+
+NULL = NullProfiler()
@@ -0,0 +1,175 @@
+import numpy as np
+import re
+
+# Extension of SPICE raw files, column name of time and unit added to each
+    # column name by variable type, same as simulator CSV exports
+RAW_EXT = '.raw'
+TIME_COL = 'time (s)'
+UNITS = {'time': 's', 'voltage': 'V', 'current': 'A', 'device_current': 'A',
+            'frequency': 'Hz'}
+VOLTAGE = re.compile(r'^v\((.+)\)$', re.IGNORECASE)
+
+def _header_lines(f):
+    """
+        Function to read raw file header up to 'Binary:' line. Headers are
+            ASCII (ngspice) or UTF-16 (LTspice)
+
+        OUTPUTS
+        :lines: - list of header lines
+        :offset: - byte offset of binary data
+    """
+    head = f.read(2)
+    f.seek(0)
+    wide = len(head) == 2 and head[1:] == b'\x00'
+    size = 2 if wide else 1
+    encoding = 'utf-16-le' if wide else 'latin-1'
+
+    lines, line = [], b''
+    while True:
+        c = f.read(size)
+        if not c:
+            raise ValueError('No Binary: section found in raw file')
+        if c.strip(b'\x00') != b'\n':
+            line += c
+            continue
+        text = line.decode(encoding).rstrip('\r')
+        line = b''
+        if text.lower().startswith('values:'):
+            raise ValueError('ASCII raw files are not supported, save raw '
+                                'file as binary')
+        if text.lower().startswith('binary:'):
+            return lines, f.tell()
+        lines.append(text)
+
+def read_header(filename):
+    """
+        Function to read header of SPICE raw file
+
+        INPUT
+        :filename: - raw filename
+
+        OUTPUT
+        :header: - dict with 'title', 'plotname', 'flags', 'points', 'offset'
+            (byte offset of data) and 'variables' list of (name, type)
+    """
+    with open(filename, 'rb') as f:
+        lines, offset = _header_lines(f)
+
+    header = {'offset': offset, 'variables': []}
+    in_vars = False
+    for text in lines:
+        if in_vars and text[:1] in ('\t', ' '):
+            fields = text.split()
+            header['variables'].append((fields[1], fields[2] if len(fields) > 2 else ''))
+            continue
+        in_vars = False
+        key, _, value = text.partition(':')
+        key = key.strip().lower()
+        if key == 'variables':
+            in_vars = True
+        elif key == 'no. points':
+            header['points'] = int(value)
+        elif key in ('title', 'plotname', 'flags'):
+            header[key] = value.strip()
+
+    return header
+
+def column_name(name, var_type):
+    """
+        Function to get CSV style column name of raw file variable, such as
+            'net1 (V)' for v(net1) or 'CLK (V)' for v(CLK)
+    """
+    if var_type.lower() == 'time':
+        return TIME_COL
+    match = VOLTAGE.match(name)
+    if match:
+        name = match.group(1)
+    unit = UNITS.get(var_type.lower())
+
+    return '%s (%s)' % (name, unit) if unit else name
+
+def record_dtype(header):
+    """
+        Function to get dtype of one point of binary data. Every variable is
+            float64 for ngspice and 'double' flagged files, LTspice stores
+            time as float64 and every other variable as float32
+    """
+    flags = header.get('flags', '').lower().split()
+    if 'complex' in flags:
+        raise ValueError('Complex (AC) raw files are not supported')
+    names = [column_name(name, var_type) for name, var_type in header['variables']]
+    if 'double' in flags or ('real' in flags and not header.get('ltspice')):
+        formats = ['<f8'] * len(names)
+    else:
+        formats = ['<f8'] + ['<f4'] * (len(names) - 1)
+
+    return np.dtype({'names': names, 'formats': formats})
+
+def load_raw(filename, ltspice=None):
+    """
+        Function to open binary SPICE raw transient output as memory-mapped
+            columns. Nothing is read until columns are used and each column
+            is a strided view into the file, no data is copied
+
+        INPUTS
+        :filename: - raw filename
+        :ltspice: - bool of whether file is LTspice (float32 values), found
+            from header encoding if not given
+
+        OUTPUT
+        :columns: - dict of column name to read-only np.array view, in same
+            order as raw file variables
+    """
+    header = read_header(filename)
+    if ltspice is None:
+        with open(filename, 'rb') as f:
+            ltspice = f.read(2)[1:] == b'\x00'
+    header['ltspice'] = ltspice
+    dtype = record_dtype(header)
+
+    # Cut off points past end of file, such as from a stopped simulation
+    with open(filename, 'rb') as f:
+        f.seek(0, 2)
+        available = (f.tell() - header['offset']) // dtype.itemsize
+    points = min(header.get('points', available), available)
+    data = np.memmap(filename, dtype=dtype, mode='r', offset=header['offset'],
+                        shape=(points,))
+
+    columns = {name: data[name] for name in dtype.names}
+    if ltspice and TIME_COL in columns:
+        # LTspice marks compressed points with negative time
+        columns[TIME_COL] = np.abs(columns[TIME_COL])
+
+    return columns
+
+def write_raw(filename, columns, title='lab3', plotname='Transient Analysis'):
+    """
+        Function to write columns as ngspice style binary raw file, such as
+            to make test files of known contents
+
+        INPUTS
+        :filename: - raw filename to write
+        :columns: - dict of column name to np.array (or pd.DataFrame), with
+            TIME_COL first. 'net1 (V)' style columns are written as v(net1)
+    """
+    names = list(columns)
+    values = np.column_stack([np.asarray(columns[name], dtype='<f8') for name in names])
+    lines = ['Title: %s' % title, 'Date: ', 'Plotname: %s' % plotname, 'Flags: real',
+                'No. Variables: %s' % len(names), 'No. Points: %s' % len(values),
+                'Variables:']
+    for i, name in enumerate(names):
+        if name == TIME_COL:
+            lines.append('\t%s\ttime\ttime' % i)
+        elif name.endswith(' (V)'):
+            lines.append('\t%s\tv(%s)\tvoltage' % (i, name[:-len(' (V)')]))
+        elif name.endswith(' (A)'):
+            lines.append('\t%s\t%s\tcurrent' % (i, name[:-len(' (A)')]))
+        else:
+            lines.append('\t%s\t%s\tnotype' % (i, name))
+    lines.append('Binary:\n')
+
+    with open(filename, 'wb') as f:
+        f.write('\n'.join(lines).encode('latin-1'))
+        f.write(np.ascontiguousarray(values).tobytes())
+
+    return filename
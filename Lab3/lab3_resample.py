@@ -0,0 +1,92 @@
+import numpy as np
+import lab3_lazy as ll
+
+# Only imported once a DataFrame is made
+pd = ll.lazy_import('pandas')
+
+TIME_COL = 'time (s)'
+
+def uniform_grid(time, dt=None, points=None):
+    """
+        Function to get uniform time grid over span of simulation
+
+        INPUTS
+        :time: - sorted np.array of simulation time points
+        :dt: - grid step, used over :points: if both given
+        :points: - number of grid points, same as :time: if neither given
+
+        OUTPUT
+        :grid: - np.array of uniform time points
+    """
+    start, stop = time[0], time[-1]
+    if dt is not None:
+        return start + dt * np.arange(int(np.floor((stop - start) / dt + 1e-9)) + 1)
+    if points is None:
+        points = len(time)
+
+    return np.linspace(start, stop, points)
+
+def interp_weights(time, grid):
+    """
+        Function to get linear interpolation weights of grid points between
+            simulation points. Found once and used for every column, repeated
+            time points (zero length steps) take the later point and grid
+            points outside simulation take value at nearest end
+
+        OUTPUTS
+        :left: - np.array of index of simulation point before each grid point
+        :right: - np.array of index of simulation point after it
+        :w: - np.array of weight of :right: point
+    """
+    time = np.asarray(time)
+    right = np.clip(np.searchsorted(time, grid, side='right'), 1, len(time) - 1)
+    left = right - 1
+    step = time[right] - time[left]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w = np.where(step > 0, (grid - time[left]) / step, 1.0)
+
+    return left, right, np.clip(w, 0, 1)
+
+def resample_values(time, values, grid):
+    """
+        Function to interpolate 2-D array of columns onto grid in one step
+
+        INPUTS
+        :time: - sorted np.array of simulation time points
+        :values: - np.array with one row per time point and one column per net
+        :grid: - np.array of time points to interpolate to
+
+        OUTPUT
+        :resampled: - np.array with one row per grid point
+    """
+    left, right, w = interp_weights(time, grid)
+    values = np.asarray(values)
+    w = w.reshape((-1,) + (1,) * (values.ndim - 1))
+
+    return values[left] * (1 - w) + values[right] * w
+
+def resample(df, grid=None, dt=None, points=None, time_col=TIME_COL):
+    """
+        Function to put every column of simulation onto uniform time grid, or
+            onto grid chosen by user, with one vectorized interpolation.
+            Sample differences on result are then real time differences
+
+        INPUTS
+        :df: - pd.DataFrame of simulation with :time_col: column
+        :grid: - np.array of time points to use, uniform grid if not given
+        :dt, points: - uniform grid step or size, see uniform_grid
+        :time_col: - time column name
+
+        OUTPUT
+        :resampled: - pd.DataFrame with same columns, :time_col: being grid
+    """
+    time = df[time_col].values
+    if grid is None:
+        grid = uniform_grid(time, dt, points)
+    nets = [col for col in df if col != time_col]
+    values = resample_values(time, df[nets].to_numpy(dtype=float), grid)
+
+    resampled = pd.DataFrame(values, columns=nets)
+    resampled.insert(list(df).index(time_col), time_col, grid)
+
+    return resampled
@@ -0,0 +1,235 @@
+import numpy as np
+import lab3_processing as lp
+import lab3_lazy as ll
+
+# Only imported once a DataFrame is made
+pd = ll.lazy_import('pandas')
+
+# Relative error of quantiles, quantiles put in stats tables and per edge
+    # metrics taken from records
+ACCURACY = 1e-3
+QUANTILES = (0.01, 0.5, 0.99)
+EDGE_METRICS = ('rise_ts', 'fall_ts', 'rise_prop_ts', 'fall_prop_ts',
+                'osc_rise_prop_ts', 'osc_fall_prop_ts', 'stage_rise_prop_ts',
+                'stage_fall_prop_ts', 'period')
+
+class RunningStats:
+    """
+        Count, mean, variance, min and max of values added in batches, plus
+            approximate quantiles, kept in constant memory. Quantiles come
+            from counts of values in log spaced buckets, each holding values
+            within :accuracy: of each other, so bucket count only grows with
+            the log of the range of values, not with how many are added. Stats of
+            separate chunks or processes are combined with merge
+
+        USE
+        stats = RunningStats()
+        stats.add(rise_ts)
+        stats.merge(other_stats)
+        stats.quantile(0.99)
+    """
+    def __init__(self, accuracy=ACCURACY):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0 # Sum of squared differences from mean
+        self.min = np.inf
+        self.max = -np.inf
+        self.zeros = 0
+        self.buckets = {} # (sign, bucket) of values to count
+
+    def _bucket_keys(self, values):
+        # Bucket k holds |values| in (gamma^(k-1), gamma^k]
+        return np.ceil(np.log(np.abs(values)) / np.log(self.gamma)).astype(np.int64)
+
+    def add(self, values):
+        """
+            Function to add np.array of values, NaN values are skipped
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        n = len(values)
+        if not n:
+            return self
+        self._combine(n, values.mean(), np.sum((values - values.mean())**2),
+                        values.min(), values.max())
+
+        nonzero = values[values != 0]
+        self.zeros += n - len(nonzero)
+        for sign, part in ((1, nonzero[nonzero > 0]), (-1, nonzero[nonzero < 0])):
+            keys, counts = np.unique(self._bucket_keys(part), return_counts=True)
+            for key, c in zip(keys.tolist(), counts.tolist()):
+                self.buckets[(sign, key)] = self.buckets.get((sign, key), 0) + c
+
+        return self
+
+    def _combine(self, n, mean, m2, lo, hi):
+        # Parallel update of count, mean and squared differences
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta**2 * self.count * n / total
+        self.count = total
+        self.min = min(self.min, lo)
+        self.max = max(self.max, hi)
+
+    def merge(self, other):
+        """
+            Function to add stats of other RunningStats with same accuracy,
+                same as if its values had been added here
+        """
+        if other.accuracy != self.accuracy:
+            raise ValueError('Cannot merge stats with accuracy %s and %s' %
+                                (self.accuracy, other.accuracy))
+        if other.count:
+            self._combine(other.count, other.mean, other.m2, other.min, other.max)
+            self.zeros += other.zeros
+            for key, c in other.buckets.items():
+                self.buckets[key] = self.buckets.get(key, 0) + c
+
+        return self
+
+    @property
+    def var(self):
+        return self.m2 / self.count if self.count else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    def _sorted_buckets(self):
+        # Bucket values and counts in increasing order of value
+        keys = sorted(self.buckets, key=lambda k: (k[0], k[0] * k[1]))
+        values = [k[0] * 2 * self.gamma**k[1] / (self.gamma + 1) for k in keys]
+        counts = [self.buckets[k] for k in keys]
+        split = sum(1 for k in keys if k[0] < 0)
+        values = values[:split] + [0.0] + values[split:]
+        counts = counts[:split] + [self.zeros] + counts[split:]
+
+        return np.array(values), np.array(counts)
+
+    def quantile(self, q):
+        """
+            Function to get approximate quantile (or np.array of quantiles for
+                np.array :q:), within accuracy of value at that rank
+        """
+        q = np.asarray(q, dtype=float)
+        if not self.count:
+            return np.full(q.shape, np.nan)[()]
+        values, counts = self._sorted_buckets()
+        rank = q * (self.count - 1)
+        pos = np.searchsorted(np.cumsum(counts), rank, side='right')
+
+        return np.clip(values[np.minimum(pos, len(values) - 1)], self.min, self.max)[()]
+
+    def histogram(self, edges):
+        """
+            Function to get approximate count of values between each pair of
+                :edges:, with values of each bucket taken at its middle
+        """
+        values, counts = self._sorted_buckets()
+        hist, _ = np.histogram(np.clip(values, self.min, self.max), bins=edges,
+                                weights=counts)
+
+        return hist.astype(np.int64)
+
+class NetStats:
+    """
+        RunningStats of each metric of each net, such as rise times and
+            propagation times, merged the same way
+
+        USE
+        stats = NetStats()
+        records_stats(records, stats)
+        stats.table()
+    """
+    def __init__(self, accuracy=ACCURACY):
+        self.accuracy = accuracy
+        self.stats = {}
+
+    def add(self, net, metric, values):
+        key = (net, metric)
+        if key not in self.stats:
+            self.stats[key] = RunningStats(self.accuracy)
+        self.stats[key].add(values)
+
+        return self
+
+    def merge(self, other):
+        for key, stats in other.stats.items():
+            if key not in self.stats:
+                self.stats[key] = RunningStats(self.accuracy)
+            self.stats[key].merge(stats)
+
+        return self
+
+    def __getitem__(self, key):
+        return self.stats[key]
+
+    def table(self, quantiles=QUANTILES):
+        """
+            Function to get pd.DataFrame indexed by net and metric with
+                'count', 'mean', 'std', 'min', 'max' and a 'q<percent>'
+                column for each of :quantiles:
+        """
+        rows = []
+        for (net, metric), s in self.stats.items():
+            row = {'net': net, 'metric': metric, 'count': s.count, 'mean': np.nan,
+                    'std': np.nan, 'min': np.nan, 'max': np.nan}
+            if s.count:
+                row.update({'mean': s.mean, 'std': s.std, 'min': s.min, 'max': s.max})
+            for q, value in zip(quantiles, np.atleast_1d(s.quantile(quantiles))):
+                row['q%g' % (100 * q)] = value
+            rows.append(row)
+        columns = ['net', 'metric', 'count', 'mean', 'std', 'min', 'max'] + \
+                    ['q%g' % (100 * q) for q in quantiles]
+
+        return pd.DataFrame(rows, columns=columns).set_index(['net', 'metric'])
+
+def edge_metrics(records):
+    """
+        Function to get every per edge metric of records with 50% time of the
+            edge each value belongs to, so values can be picked by time
+
+        OUTPUT
+        :metrics: - list of (net, metric, values, edge times) tuples, metrics
+            named as in EDGE_METRICS. 'period' is time between rising edges
+    """
+    metrics = []
+    for net, record in records.items():
+        if 'rise_edges' not in record:
+            continue
+        edge_ts = {edge: lp.half_times(record, edge, None) for edge in ('rise', 'fall')}
+        for metric in EDGE_METRICS:
+            if metric == 'period':
+                values = np.diff(edge_ts['rise'])
+            elif metric in record:
+                values = np.asarray(record[metric])
+            else:
+                continue
+            edge = 'fall' if 'fall' in metric else 'rise'
+            # Unmatched edges are only ever left off start of propagation times
+            ts = edge_ts[edge][len(edge_ts[edge]) - len(values):]
+            metrics.append((net, metric, values, ts))
+
+    return metrics
+
+def records_stats(records, stats=None, start=-np.inf, stop=np.inf):
+    """
+        Function to add per edge metrics of records to NetStats
+
+        INPUTS
+        :records: - dict of processed data
+        :stats: - NetStats to add to, new one if not given
+        :start, stop: - only edges with 50% time in [start, stop) are added
+
+        OUTPUT
+        :stats: - NetStats added to
+    """
+    if stats is None:
+        stats = NetStats()
+    for net, metric, values, ts in edge_metrics(records):
+        stats.add(net, metric, values[(ts >= start) & (ts < stop)])
+
+    return stats
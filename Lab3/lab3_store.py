@@ -0,0 +1,235 @@
+import numpy as np
+import json, os, glob, tempfile
+import lab3_lazy as ll
+
+# Only imported once a DataFrame is made
+pd = ll.lazy_import('pandas')
+
+# Sidecar format name and version written into every saved records file
+STORE_FORMAT = 'lab3_records'
+STORE_VERSION = 1
+
+# Mode files are written with, mkstemp alone leaves temp files owner only
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+FILE_MODE = 0o666 & ~_UMASK
+
+def _split(value, arrays):
+    """
+        Function to turn records value into JSON-able sidecar entry. Arrays
+            are added to :arrays: and replaced by a reference to their name
+    """
+    if isinstance(value, dict):
+        return {k: _split(v, arrays) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        value = np.asarray(value)
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        name = 'a%s' % len(arrays)
+        arrays[name] = value
+        return {'array': name}
+    # None and bools are kept as JSON null, true and false
+    if value is None or isinstance(value, (bool, np.bool_)):
+        return value if value is None else bool(value)
+    if isinstance(value, (np.integer, int)):
+        return int(value)
+    if isinstance(value, (np.floating, float)):
+        return float(value)
+
+    return str(value)
+
+def _join(entry, arrays):
+    # Reverse of _split, swaps array references back for arrays
+    if isinstance(entry, dict):
+        if set(entry) == {'array'}:
+            return arrays[entry['array']]
+        return {k: _join(v, arrays) for k, v in entry.items()}
+
+    return entry
+
+def _write_temp(directory, write):
+    # Write whole file to hidden temp file in :directory: with write(f), so
+        # it can be moved into place in one step. Temp file is removed if
+        # writing fails
+    fd, tmp = tempfile.mkstemp(prefix='.tmp-', suffix='.part', dir=directory)
+    try:
+        os.chmod(tmp, FILE_MODE)
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+    return tmp
+
+def _replace(filename, write):
+    # Write :filename: through a temp file, so readers see old or new file
+        # but never a partly written one
+    tmp = _write_temp(os.path.dirname(os.path.abspath(filename)), write)
+    try:
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def save_records(records, filename):
+    """
+        Function to save records dict with arrays kept as typed binary arrays.
+            Two files are written, JSON sidecar at :filename: holding the
+            records layout, strings and single values, and .npz next to it
+            holding every array with its dtype. Each file is written to a
+            temp file then moved into place, .npz first, so a sidecar never
+            points at a missing or partly written .npz
+
+        INPUTS
+        :records: - dict of processed data, not changed
+        :filename: - JSON sidecar filename, .json added if missing
+
+        OUTPUT
+        :filename: - JSON sidecar filename written
+    """
+    filename = str(filename)
+    if not filename.split('.')[-1].lower() == 'json':
+        filename += '.json'
+    array_file = filename[:-len('.json')] + '.npz'
+
+    arrays = {}
+    layout = _split(records, arrays)
+    _replace(array_file, lambda f: np.savez(f, **arrays))
+
+    sidecar = {'format': STORE_FORMAT, 'version': STORE_VERSION,
+                'arrays': os.path.basename(array_file), 'records': layout}
+    text = json.dumps(sidecar, indent=4).encode()
+    _replace(filename, lambda f: f.write(text))
+
+    return filename
+
+def load_records(filename):
+    """
+        Function to load records saved with save_records
+
+        INPUT
+        :filename: - JSON sidecar filename
+
+        OUTPUT
+        :records: - dict of processed data with same layout and array dtypes
+            as was saved
+    """
+    with open(filename) as f:
+        sidecar = json.load(f)
+    if sidecar.get('format') != STORE_FORMAT:
+        raise ValueError('%s was not saved with save_records' % filename)
+
+    array_file = os.path.join(os.path.dirname(filename), sidecar['arrays'])
+    with np.load(array_file) as npz:
+        arrays = {k: npz[k] for k in npz.files}
+
+    return _join(sidecar['records'], arrays)
+
+def records_table(records, run):
+    """
+        Function to flatten records into long table with one row per value.
+            Every 1-D float array (crossing times, rise/fall times, propagation
+            times) and single float value is kept, indicies are left out
+
+        INPUTS
+        :records: - dict of processed data
+        :run: - name of run records came from
+
+        OUTPUT
+        :table: - pd.DataFrame with 'run', 'net', 'metric', 'edge' and 'value'
+            columns
+    """
+    nets, metrics, edges, values = [], [], [], []
+    for net in records:
+        for metric, value in records[net].items():
+            if isinstance(value, (float, np.floating)):
+                value = np.array([value])
+            elif not (isinstance(value, np.ndarray) and value.ndim == 1 and
+                        value.dtype.kind == 'f'):
+                continue
+            nets.append(np.full(len(value), net, dtype=object))
+            metrics.append(np.full(len(value), metric, dtype=object))
+            edges.append(np.arange(len(value), dtype=np.int32))
+            values.append(value.astype(np.float64))
+
+    if not values:
+        return pd.DataFrame({'run': [], 'net': [], 'metric': [], 'edge': [], 'value': []})
+
+    table = pd.DataFrame({'net': np.concatenate(nets), 'metric': np.concatenate(metrics),
+                            'edge': np.concatenate(edges), 'value': np.concatenate(values)})
+    table.insert(0, 'run', str(run))
+
+    return table
+
+def append_table(records, table_dir, run):
+    """
+        Function to add records of one run to table of many runs. Each append
+            is written as its own part file of typed columns, so adding runs
+            never rewrites earlier ones. Each part is written to a temp file
+            then linked to the next free part name, which fails if the name
+            is taken, so appends from several processes at once never share
+            a number and readers never see a partly written part
+
+        INPUTS
+        :records: - dict of processed data
+        :table_dir: - folder holding table part files
+        :run: - name of run, such as CSV filename
+
+        OUTPUT
+        :part: - part filename written
+    """
+    os.makedirs(table_dir, exist_ok=True)
+    table = records_table(records, run)
+
+    # Name columns saved as fixed width strings so no pickling is needed
+    columns = {col: table[col].to_numpy() for col in ('edge', 'value')}
+    for col in ('run', 'net', 'metric'):
+        columns[col] = table[col].to_numpy().astype(str)
+
+    # Next free part number, taken by whichever append links it first
+    tmp = _write_temp(table_dir, lambda f: np.savez(f, **columns))
+    try:
+        n = len(glob.glob(os.path.join(table_dir, 'part-*.npz')))
+        while True:
+            part = os.path.join(table_dir, 'part-%05d.npz' % n)
+            try:
+                os.link(tmp, part)
+                break
+            except FileExistsError:
+                n += 1
+    finally:
+        os.unlink(tmp)
+
+    return part
+
+def load_table(table_dir, run=None, net=None, metric=None):
+    """
+        Function to load table of runs written by append_table, keeping only
+            rows that match any given run, net or metric
+
+        INPUTS
+        :table_dir: - folder holding table part files
+        :run: - run name or list of run names to keep
+        :net: - net name or list of net names to keep
+        :metric: - metric name or list of metric names to keep, such as
+            'rise_prop_ts'
+
+        OUTPUT
+        :table: - pd.DataFrame with 'run', 'net', 'metric', 'edge' and 'value'
+            columns
+    """
+    parts = []
+    for part in sorted(glob.glob(os.path.join(table_dir, 'part-*.npz'))):
+        with np.load(part) as npz:
+            parts.append(pd.DataFrame({k: npz[k] for k in ('run', 'net', 'metric',
+                                                            'edge', 'value')}))
+    if not parts:
+        return records_table({}, None)
+    table = pd.concat(parts, ignore_index=True)
+
+    for col, keep in (('run', run), ('net', net), ('metric', metric)):
+        if keep is not None:
+            keep = [keep] if isinstance(keep, str) else list(keep)
+            table = table[table[col].isin(keep)]
+
+    return table.reset_index(drop=True)
@@ -0,0 +1,235 @@
+import pandas as pd
+import numpy as np
+import lab3_processing as lp
+import lab3_analysis as la
+import lab3_netlist as ln
+import lab3_stats as lst
+from multiprocessing import Pool
+import os
+
+# Data filename and number of CSV rows held in memory at once
+OSC_DATA = os.path.join('data', 'oscillator-3.csv')
+CHUNK_ROWS = 100000
+
+def column_max(filename, chunksize=CHUNK_ROWS):
+    """
+        Function to get max value of every column in CSV without loading
+            the whole file
+
+        INPUTS
+        :filename: - CSV filename to read
+        :chunksize: - number of rows to read at once
+
+        OUTPUT
+        :raw_max: - pd.Series of max value for each column
+    """
+    raw_max = None
+    for chunk in pd.read_csv(filename, chunksize=chunksize):
+        chunk_max = chunk.max()
+        raw_max = chunk_max if raw_max is None else np.maximum(raw_max, chunk_max)
+
+    return raw_max
+
+def stream_crossings(filename, raw_max, chunksize=CHUNK_ROWS, params=None):
+    """
+        Function to find top, bot and half crossings of every net in CSV by
+            reading it in chunks. Last row of each chunk is carried into the
+            next one so crossings on chunk boundaries are not missed
+
+        INPUTS
+        :filename: - CSV filename to read
+        :raw_max: - pd.Series or dict of max value for each net
+        :chunksize: - number of rows to read at once
+        :params: - lab3_analysis.trigger_params dict, lab3_analysis
+            constants if not given
+
+        OUTPUT
+        :crossings: - dict with debounced crossing indicies and times for
+            each net as {net: {'inds': [top, bot, half], 'ts': [top, bot, half]}}
+    """
+    params = params if params is not None else la.trigger_params()
+    crossings = {}
+    last = None
+    offset = 0
+    for chunk in pd.read_csv(filename, chunksize=chunksize):
+        # Put last row of previous chunk in front so crossings between chunks
+            # are found, then shift indicies back by that row
+        start = offset
+        if last is not None:
+            chunk = pd.concat([last, chunk])
+            start -= 1
+        time = chunk[la.TIME_COL].values
+
+        for net in list(chunk):
+            if net == la.TIME_COL:
+                continue
+            levels = la.trigger_levels(raw_max[net], params)
+            if net not in crossings:
+                crossings[net] = {'inds': [[] for l in levels], 'ts': [[] for l in levels],
+                                    'start': chunk[net].values[0]}
+
+            inds, ts = lp.find_crossings(chunk[net].values, levels, time)
+            for j in range(len(levels)):
+                crossings[net]['inds'][j].append(inds[j] + start)
+                crossings[net]['ts'][j].append(ts[j])
+
+        offset = start + chunk.shape[0]
+        last = chunk.iloc[-1:]
+
+    # Join crossings found in each chunk together then debounce them
+    for net in crossings:
+        for key in ('inds', 'ts'):
+            crossings[net][key] = [np.concatenate(c) for c in crossings[net][key]]
+        crossings[net]['inds'], crossings[net]['ts'] = lp.debounce_crossings(
+                        crossings[net]['inds'], crossings[net]['ts'],
+                        la.trigger_levels(raw_max[net], params), crossings[net]['start'],
+                        params['min_dwell'])
+
+    return crossings
+
+def riseFall_stream(filename, chunksize=CHUNK_ROWS, raw_max=None, saveJson=False,
+                    inv_eval=0, netlist=None, params=None):
+    """
+        Function to get same records as lab3_analysis.riseFall_times from CSV
+            too large to load at once. Only one chunk of samples is held in
+            memory at a time, edges are paired once all crossings are found
+
+        INPUTS
+        :filename: - CSV filename to read
+        :chunksize: - number of rows to read at once
+        :raw_max: - dict of max value for each net, found with extra pass
+            through file if not given
+        :saveJson: - string of filename to save records dict to or False to not save
+        :inv_eval: - bool of whether a single inverter is being evaluated
+        :netlist: - netlist filename to order nets and add stage propagation
+            times with, see lab3_analysis.riseFall_times
+        :params: - lab3_analysis.trigger_params dict, see stream_crossings
+
+        OUTPUT
+        :records: - dict of processed data
+    """
+    if raw_max is None:
+        raw_max = column_max(filename, chunksize)
+
+    crossings = stream_crossings(filename, raw_max, chunksize, params)
+
+    order = ln.column_order(list(crossings), netlist) if netlist else []
+    nets = [net for net, driver in order]
+    nets += [net for net in crossings if net not in nets]
+    input_col = nets[0] if order else None
+
+    # Crossing times are interpolated already so timescale is not needed
+    records = {}
+    for net in nets:
+        records[net] = la.crossing_record(crossings[net]['inds'],
+                                            crossings[net]['ts'], None)
+        inv_eval = la.prop_record(records, net, None, inv_eval, input_col)
+
+    for net, driver in order:
+        la.stage_record(records, net, driver, None)
+    la.mean_prop_times(records)
+
+    if saveJson:
+        la.save_records(records, saveJson)
+
+    return records
+
+def _add_window(prev, cur, nxt, raw_max, netlist, inv_eval, stats, params=None):
+    """
+        Function to analyze chunk :cur: with chunks on either side of it and
+            add edges with 50% point in :cur: to stats, built same way as
+            riseFall_stream records
+
+        OUTPUT
+        :inv_eval: - :inv_eval: input, set if input net is not an oscillator
+    """
+    window = pd.concat([c for c in (prev, cur, nxt) if c is not None])
+    time = window[la.TIME_COL].values
+    columns = [net for net in window if net != la.TIME_COL]
+    order = ln.column_order(columns, netlist) if netlist else []
+    nets = [net for net, driver in order]
+    nets += [net for net in columns if net not in nets]
+    input_col = nets[0] if order else None
+
+    records = {}
+    for net in nets:
+        inds, ts = la.net_crossings(window[net].values, time, raw_max[net],
+                                    params=params)
+        records[net] = la.crossing_record(inds, ts, time)
+        inv_eval = la.prop_record(records, net, time, inv_eval, input_col)
+    for net, driver in order:
+        la.stage_record(records, net, driver, time)
+
+    start = cur[la.TIME_COL].values[0] if prev is not None else -np.inf
+    stop = nxt[la.TIME_COL].values[0] if nxt is not None else np.inf
+    lst.records_stats(records, stats, start, stop)
+
+    return inv_eval
+
+def stream_stats(filename, chunksize=CHUNK_ROWS, raw_max=None, inv_eval=0,
+                    netlist=None, stats=None, params=None):
+    """
+        Function to get count, mean, spread, min/max and quantiles of every
+            per edge metric (lab3_stats.EDGE_METRICS) of every net without
+            keeping per edge arrays. Each chunk is analyzed along with the
+            chunks on either side of it and only edges with their 50% point
+            in the chunk are added, so memory does not grow with the number
+            of cycles
+
+        INPUTS
+        :filename: - CSV filename to read
+        :chunksize: - number of rows to read at once, should hold more than
+            the longest propagation time
+        :raw_max: - dict of max value for each net, found with extra pass
+            through file if not given
+        :inv_eval: - bool of whether a single inverter is being evaluated
+        :netlist: - netlist filename, see riseFall_stream
+        :stats: - lab3_stats.NetStats to add to, new one if not given
+        :params: - lab3_analysis.trigger_params dict, lab3_analysis
+            constants if not given
+
+        OUTPUT
+        :stats: - lab3_stats.NetStats of file
+    """
+    if raw_max is None:
+        raw_max = column_max(filename, chunksize)
+    if stats is None:
+        stats = lst.NetStats()
+
+    prev, cur = None, None
+    for nxt in pd.read_csv(filename, chunksize=chunksize):
+        if cur is not None:
+            inv_eval = _add_window(prev, cur, nxt, raw_max, netlist, inv_eval,
+                                    stats, params)
+        prev, cur = cur, nxt
+    if cur is not None:
+        _add_window(prev, cur, None, raw_max, netlist, inv_eval, stats, params)
+
+    return stats
+
+def _file_stats(task):
+    # Pool worker function, stream_stats of one file
+    filename, chunksize, netlist, params = task
+    return stream_stats(filename, chunksize, netlist=netlist, params=params)
+
+def stats_files(filenames, chunksize=CHUNK_ROWS, processes=None, netlist=None,
+                params=None):
+    """
+        Function to get stream_stats of many files with a process pool. Only
+            the small NetStats of each file are sent back, merge them for
+            stats over all files. Trigger settings are taken from
+            lab3_analysis here if :params: is not given and sent to workers
+
+        OUTPUT
+        :stats: - dict of filename to lab3_stats.NetStats
+    """
+    params = params if params is not None else la.trigger_params()
+    with Pool(processes) as pool:
+        results = pool.map(_file_stats, [(f, chunksize, netlist, params)
+                                            for f in filenames])
+
+    return dict(zip(filenames, results))
+
+if __name__ == '__main__':
+    records = riseFall_stream(OSC_DATA, saveJson=os.path.join('data',
+                                                    'lab3_osc_records.json'))
@@ -0,0 +1,357 @@
+import numpy as np
+import lab3_processing as lp
+import lab3_analysis as la
+import lab3_netlist as ln
+import lab3_waveform as lw
+import lab3_lazy as ll
+
+# Only imported once a DataFrame is made
+pd = ll.lazy_import('pandas')
+
+# Default threshold levels (fraction of max value) swept, 10% to 90%, and
+    # metrics put in sweep tables
+LEVELS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9)
+SWEEP_METRICS = ('rise_cross_ts', 'fall_cross_ts', 'rise_ts', 'fall_ts',
+                    'rise_prop_ts', 'fall_prop_ts', 'stage_rise_prop_ts',
+                    'stage_fall_prop_ts')
+
+def sweep_levels(levels, params=None):
+    """
+        Function to get every level crossings are needed for, :levels: with
+            the level each is paired with for transition times (1 - level),
+            the half trigger edges are anchored to and the bot and top
+            triggers complete edges must cross
+
+        INPUTS
+        :levels: - fractions of max value to find times at
+        :params: - lab3_analysis.trigger_params dict, lab3_analysis
+            constants if not given
+
+        OUTPUT
+        :all_levels: - sorted np.array of unique levels
+    """
+    params = params if params is not None else la.trigger_params()
+    levels = np.asarray(levels, dtype=float)
+    all_levels = np.concatenate([levels, 1 - levels, [params['half_trigger'],
+                                                        params['bot_trigger'],
+                                                        params['top_trigger']]])
+
+    return np.unique(np.round(all_levels, 12))
+
+def _edge_times(ts, start, level):
+    # Rising and falling crossing times of one level, debounced crossings
+        # alternate with first one rising if trace starts below level
+    first = 0 if start < level else 1
+    return ts[first::2], ts[1 - first::2]
+
+def _assign(ts, anchor_ts, anchor_rising, rising, before, n_edges):
+    """
+        Function to put crossings of one level in the edge they belong to.
+            Crossings before the 50% point of an edge go with the next 50%
+            crossing and crossings after it with the previous one, which must
+            go the same way. Where several crossings fall in one edge the one
+            closest to its 50% point is kept
+
+        INPUTS
+        :ts: - np.array of rising or falling crossing times of level
+        :anchor_ts: - sorted np.array of every 50% crossing time
+        :anchor_rising: - bool np.array of which 50% crossings are rising
+        :rising: - bool of whether :ts: are rising crossings
+        :before: - bool of whether level is crossed before 50% point
+        :n_edges: - number of rising or falling 50% crossings
+
+        OUTPUT
+        :edge_ts: - np.array of crossing time of each edge, NaN where edge
+            does not cross level
+    """
+    edge_ts = np.full(n_edges, np.nan)
+    if before:
+        pos = np.searchsorted(anchor_ts, ts, side='left')
+        ts, pos = ts[::-1], pos[::-1]
+    else:
+        pos = np.searchsorted(anchor_ts, ts, side='right') - 1
+    valid = (pos >= 0) & (pos < len(anchor_ts))
+    valid[valid] = anchor_rising[pos[valid]] == rising
+    ts, pos = ts[valid], pos[valid]
+
+    # Edge number of each anchor among anchors going same way
+    rank = np.cumsum(anchor_rising == rising) - 1
+    edge, first = np.unique(rank[pos], return_index=True)
+    edge_ts[edge] = ts[first]
+
+    return edge_ts
+
+def _row(levels, level):
+    # Row of levels closest to level
+    return int(np.argmin(np.abs(levels - level)))
+
+def net_sweep(points, time, levels, raw_max=None, coding=None, block=None,
+                params=None):
+    """
+        Function to find crossing times of every level for every edge of a
+            trace. Crossings of all levels and their hysteresis bands are
+            found with one lab3_processing.find_crossings call, so the trace
+            is only gone over once however many levels there are
+
+        INPUTS
+        :points: - np.array of trace y-points
+        :time: - np.array of trace x-points
+        :levels: - sorted fractions of max value to find crossings of
+        :raw_max: - max value of trace (V), found from points if not given
+        :coding: - (scale, offset) when :points: are stored values, see
+            lab3_analysis.net_crossings
+        :block: - points banded at a time, see lab3_processing.find_crossings
+        :params: - lab3_analysis.trigger_params dict, lab3_analysis
+            constants if not given. Edges are anchored to half trigger,
+            which must be in :levels: along with bot and top triggers, see
+            sweep_levels. Hysteresis band is narrowed for levels near the
+            rails so it stays inside 0 to max value
+
+        OUTPUT
+        :sweep: - dict with 'levels', 'rise' and 'fall' np.arrays of crossing
+            times shaped (levels, edges), NaN where an edge does not cross a
+            level. Edges are in time order and are the complete edges
+            lab3_processing.pair_edges finds from bot, half and top
+            crossings, same as lab3_analysis.riseFall_times
+    """
+    levels = np.asarray(levels, dtype=float)
+    params = params if params is not None else la.trigger_params()
+    ref = params['half_trigger']
+    scale, offset = coding if coding is not None else (1, 0)
+    if raw_max is None:
+        raw_max = np.max(points) * scale + offset
+    band = np.minimum(params['hysteresis'], np.minimum(levels, 1 - levels) / 2)
+
+    band_levels = []
+    for level, h in zip(levels * raw_max, band * raw_max):
+        band_levels.extend(lp.hysteresis_levels([level], h))
+    band_levels = (np.asarray(band_levels) - offset) / scale
+    inds, ts = lp.find_crossings(points, band_levels, time, block)
+    inds, ts = lp.debounce_crossings(inds, ts, band_levels, points[0],
+                                        params['min_dwell'])
+
+    # Every 50% crossing bounds an edge, crossings of other levels are put
+        # in edges between them
+    k = _row(levels, ref)
+    start = points[0]
+    rise_ref, fall_ref = _edge_times(ts[k], start, band_levels[3 * k + 1])
+    anchor_ts = np.concatenate([rise_ref, fall_ref])
+    anchor_rising = np.concatenate([np.ones(len(rise_ref), dtype=bool),
+                                    np.zeros(len(fall_ref), dtype=bool)])
+    order = np.argsort(anchor_ts, kind='stable')
+    anchor_ts = anchor_ts[order]
+    anchor_rising = anchor_rising[order]
+
+    rise = np.full((len(levels), len(rise_ref)), np.nan)
+    fall = np.full((len(levels), len(fall_ref)), np.nan)
+    for j, level in enumerate(levels):
+        up, down = _edge_times(ts[j], start, band_levels[3 * j + 1])
+        rise[j] = _assign(up, anchor_ts, anchor_rising, True, level <= ref,
+                            len(rise_ref))
+        fall[j] = _assign(down, anchor_ts, anchor_rising, False, level >= ref,
+                            len(fall_ref))
+
+    # Only complete edges are kept, partial edges at trace ends drop out
+    bot = _row(levels, params['bot_trigger'])
+    top = _row(levels, params['top_trigger'])
+    rise_edges, fall_edges = lp.pair_edges({'bot': inds[bot], 'half': inds[k],
+                                            'top': inds[top], 'bot_ts': ts[bot],
+                                            'half_ts': ts[k], 'top_ts': ts[top]})
+    rise = rise[:, np.isin(rise_ref, rise_edges['mid_ts'])]
+    fall = fall[:, np.isin(fall_ref, fall_edges['mid_ts'])]
+
+    return {'levels': levels, 'rise': rise, 'fall': fall}
+
+def _prev_edge(out_ts, in_ts):
+    # Position of latest input edge at or before each output edge, -1 if none
+    return np.searchsorted(in_ts, out_ts, side='right') - 1
+
+def _delays(out_ts, in_ts, pos):
+    # Delays (levels, edges) from matched input edge at each level
+    delays = np.full(out_ts.shape, np.nan)
+    matched = pos >= 0
+    delays[:, matched] = out_ts[:, matched] - in_ts[:, pos[matched]]
+
+    return delays
+
+def sweep_prop_times(node, source, k, inverting=None):
+    """
+        Function to get propagation times of node against source at every
+            level. Edges are matched once at the 50% level the same way as
+            lab3_processing.calc_prop_times and the same match is used at
+            every other level
+
+        INPUTS
+        :node, source: - net_sweep outputs, same levels. Same dict for
+            oscillator delay of net against itself
+        :k: - row of 50% level
+        :inverting: - see lab3_processing.calc_prop_times
+
+        OUTPUTS
+        :rise_prop_ts: - np.array (levels, rising edges of node)
+        :fall_prop_ts: - np.array (levels, falling edges of node)
+    """
+    if node is source:
+        inverting = True
+    delays = {}
+    for polarity in (True, False):
+        if inverting is not None and polarity != inverting:
+            continue
+        rise_src, fall_src = (('fall', 'rise') if polarity else ('rise', 'fall'))
+        rise_pos = _prev_edge(node['rise'][k], source[rise_src][k])
+        fall_pos = _prev_edge(node['fall'][k], source[fall_src][k])
+        delays[polarity] = (_delays(node['rise'], source[rise_src], rise_pos),
+                            _delays(node['fall'], source[fall_src], fall_pos))
+
+    # Shorter delays are from the input edges actually causing node edges
+    def median_delay(polarity):
+        all_ts = np.concatenate([d[k] for d in delays[polarity]])
+        all_ts = all_ts[~np.isnan(all_ts)]
+        return np.median(all_ts) if len(all_ts) else np.inf
+
+    return delays[min(delays, key=median_delay)]
+
+def sweep_metrics(sweep, k):
+    """
+        Function to get per edge crossing and transition times at every level
+
+        INPUTS
+        :sweep: - net_sweep output
+        :k: - row of 50% level
+
+        OUTPUT
+        :metrics: - dict of metric to np.array (levels, edges). 'rise_cross_ts'
+            and 'fall_cross_ts' are crossing times from 50% crossing,
+            'rise_ts' and 'fall_ts' are transition times from level to
+            1 - level, NaN for levels at or above 50%
+    """
+    levels = sweep['levels']
+    rise, fall = sweep['rise'], sweep['fall']
+    metrics = {'rise_cross_ts': rise - rise[k], 'fall_cross_ts': fall - fall[k]}
+
+    # Row of 1 - level for each level below 50%, NaN rows otherwise
+    pair = np.searchsorted(levels, np.round(1 - levels, 12))
+    pair = np.minimum(pair, len(levels) - 1)
+    lower = (levels < levels[k]) & np.isclose(levels[pair], 1 - levels)
+    metrics['rise_ts'] = np.where(lower[:, None], rise[pair] - rise, np.nan)
+    metrics['fall_ts'] = np.where(lower[:, None], fall - fall[pair], np.nan)
+
+    return metrics
+
+def sweep_times(df, levels=LEVELS, inv_eval=0, netlist=None, input_col=None,
+                memory_budget=None, params=None):
+    """
+        Function to find crossing, transition and propagation times of every
+            net at every threshold level, such as for timing library style
+            tables. Each net is gone over once for all levels
+
+        INPUTS
+        :df: - dataframe of points for inverter net traces, or
+            lab3_waveform.Waveforms of them. Not changed
+        :levels: - fractions of max value of each net to find times at
+        :inv_eval: - bool of whether a single inverter is being evaluated,
+            input net gets no oscillator propagation times
+        :netlist: - netlist filename, nets also get propagation times against
+            their driver, see lab3_analysis.riseFall_times
+        :input_col: - net propagation times are referenced to,
+            lab3_analysis.INPUT_COL if not given
+        :memory_budget: - bytes of working arrays finding crossings of a net
+            may use, whole net at once if not given
+        :params: - lab3_analysis.trigger_params dict, lab3_analysis
+            constants if not given, see net_sweep
+
+        OUTPUT
+        :sweeps: - dict of net to dict of 'levels' and metric np.arrays
+            (levels, edges), metrics as in SWEEP_METRICS, plus 'rise' and
+            'fall' crossing times from net_sweep
+    """
+    block = lw.block_size(memory_budget) if memory_budget else None
+    params = params if params is not None else la.trigger_params()
+    all_levels = sweep_levels(levels, params)
+    k = _row(all_levels, params['half_trigger'])
+
+    wf = df if isinstance(df, lw.Waveforms) else None
+    time = wf.time if wf is not None else df[la.TIME_COL].values
+    columns = [net for net in df if net != la.TIME_COL]
+    order = ln.column_order(columns, netlist) if netlist else []
+    if order:
+        input_col = order[0][0]
+    elif input_col is None:
+        input_col = la.INPUT_COL
+
+    sweeps = {}
+    for net in columns:
+        if wf is not None:
+            points, coding, raw_max = wf.codes(net), wf.coding(net), wf.max(net)
+        else:
+            points, coding, raw_max = df[net].values, None, None
+        sweeps[net] = net_sweep(points, time, all_levels, raw_max, coding, block,
+                                params)
+        sweeps[net].update(sweep_metrics(sweeps[net], k))
+
+    for net in sweeps:
+        if net != input_col and input_col in sweeps:
+            source = sweeps[input_col]
+        elif net == input_col and not inv_eval:
+            source = sweeps[net]
+        else:
+            continue
+        rise_prop, fall_prop = sweep_prop_times(sweeps[net], source, k)
+        sweeps[net]['rise_prop_ts'] = rise_prop
+        sweeps[net]['fall_prop_ts'] = fall_prop
+    for net, driver in order:
+        if driver in sweeps:
+            rise_prop, fall_prop = sweep_prop_times(sweeps[net], sweeps[driver], k)
+            sweeps[net]['stage_rise_prop_ts'] = rise_prop
+            sweeps[net]['stage_fall_prop_ts'] = fall_prop
+
+    return sweeps
+
+def sweep_table(sweeps, levels=LEVELS):
+    """
+        Function to summarize sweep_times output as table
+
+        INPUTS
+        :sweeps: - sweep_times output
+        :levels: - levels to put in table, others found for transition times
+            are left out
+
+        OUTPUT
+        :table: - pd.DataFrame indexed by level, net and metric with 'count',
+            'mean', 'std', 'min' and 'max' of per edge values. Levels with
+            no values for a metric (transition times at or above 50%) are
+            left out. table['mean'].unstack('metric') gives one row per level
+            and net
+    """
+    levels = np.round(np.asarray(levels, dtype=float), 12)
+    rows = []
+    for level in levels:
+        for net, sweep in sweeps.items():
+            j = _row(sweep['levels'], level)
+            for metric in SWEEP_METRICS:
+                if metric not in sweep:
+                    continue
+                values = sweep[metric][j]
+                values = values[~np.isnan(values)]
+                if not len(values):
+                    continue
+                rows.append({'level': level, 'net': net, 'metric': metric,
+                            'count': len(values), 'mean': values.mean(),
+                            'std': values.std(), 'min': values.min(),
+                            'max': values.max()})
+    columns = ['level', 'net', 'metric', 'count', 'mean', 'std', 'min', 'max']
+
+    return pd.DataFrame(rows, columns=columns).set_index(['level', 'net', 'metric'])
+
+def characterize(df, levels=LEVELS, **kwargs):
+    """
+        Function to get sweep_table of sweep_times in one call, see
+            sweep_times for kwargs
+    """
+    return sweep_table(sweep_times(df, levels, **kwargs), levels)
+
+if __name__ == '__main__':
+    import lab3_cache as lc
+    df = lc.read_csv_cached(la.OSC_DATA)
+    table = characterize(df)
+    print(table['mean'].unstack('metric').to_string())
@@ -0,0 +1,163 @@
+import pandas as pd
+import numpy as np
+from scipy.special import expit
+import os, sys
+
+# JK truth table is kept with flip-flop analysis
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'Final_JKFlipFlop'))
+import plotdata as pdt
+
+# Defaults close to oscillator-3.csv, 11 stage ring at 5V with ~2.3ns period
+TIME_COL = 'time (s)'
+VDD = 5.0
+STAGES = 11
+PERIOD = 2.34e-9
+EDGE_TIME = 60e-12 # 20%-80% time of every edge
+LN4 = np.log(4) # Logistic edge goes 20%-80% in 2*ln(4) time constants
+
+def sample_times(duration, samples, adaptive=0, seed=None):
+    """
+        Function to get simulation time points. Steps are even, or uneven
+            like Spectre adaptive stepping when :adaptive: is set
+
+        INPUTS
+        :duration: - length of simulation (s)
+        :samples: - number of time points
+        :adaptive: - spread of log of step sizes, 0 for even steps. 1 gives
+            steps ranging over about a factor of 50
+        :seed: - random seed
+
+        OUTPUT
+        :time: - sorted np.array of time points from 0 to :duration:
+    """
+    if not adaptive:
+        return np.linspace(0, duration, samples)
+    rng = np.random.default_rng(seed)
+    steps = rng.lognormal(0, adaptive, samples - 1)
+    time = np.concatenate([[0], np.cumsum(steps)])
+
+    return time * (duration / time[-1])
+
+def _half_starts(duration, period, jitter, rng):
+    # Start time of each half cycle from one period before 0. Each half is
+        # drawn on its own with rms jitter/sqrt(2), so rising to rising and
+        # falling to falling periods both have rms :jitter:
+    halves = 2 * int(np.ceil(duration / period)) + 6
+    lengths = np.full(halves, period / 2)
+    if jitter:
+        lengths += rng.normal(0, jitter / np.sqrt(2), halves)
+
+    return np.concatenate([[0], np.cumsum(lengths)]) - lengths[0] - lengths[1]
+
+def _phase(time, starts):
+    # Cycle count at each time point from half cycle starts, cycle starting
+        # at 0 is cycle 0
+    return np.interp(time, starts, np.arange(len(starts)) / 2 - 1.0)
+
+def _square(phase, period, edge_time, vdd):
+    # Square wave rising at whole cycles, falling half way, logistic edges
+    x = phase - np.floor(phase + 0.25)
+    distance = (0.25 - np.abs(x - 0.25)) * period
+    tau = edge_time / (2 * LN4)
+
+    return vdd * expit(distance / tau)
+
+def ring_oscillator(samples=10**4, stages=STAGES, cycles=None, period=PERIOD,
+                    edge_time=EDGE_TIME, noise=0, jitter=0, adaptive=0, vdd=VDD,
+                    seed=None):
+    """
+        Function to make waveforms of N stage inverter ring oscillator in same
+            layout as simulator CSVs. Stage k output is stage k-1 output
+            inverted and delayed by period/(2*stages). Every stage is the
+            same phase trace shifted in time, so every stage has the same
+            jitter
+
+        INPUTS
+        :samples: - number of time points
+        :stages: - number of inverters in ring, should be odd
+        :cycles: - number of oscillation periods, samples/1000 (at least 2)
+            if not given
+        :period: - oscillation period (s)
+        :edge_time: - 20%-80% rise and fall time (s)
+        :noise: - rms of gaussian noise added to every point (V)
+        :jitter: - rms period jitter (s), every cycle gets its own length
+        :adaptive: - uneven time steps, see sample_times
+        :vdd: - supply voltage, top of waveforms
+        :seed: - random seed
+
+        OUTPUT
+        :df: - pd.DataFrame with TIME_COL and 'net1 (V)' ... columns
+    """
+    rng = np.random.default_rng(seed)
+    if cycles is None:
+        cycles = max(2, samples // 1000)
+    time = sample_times(cycles * period, samples, adaptive, seed)
+    starts = _half_starts(cycles * period, period, jitter, rng)
+    stage_delay = period / (2 * stages)
+
+    df = pd.DataFrame({TIME_COL: time})
+    for k in range(stages):
+        # Odd stages are inverted
+        wave = _square(_phase(time - k * stage_delay, starts), period, edge_time, vdd)
+        if k % 2:
+            wave = vdd - wave
+        if noise:
+            wave += rng.normal(0, noise, samples)
+        df['net%s (V)' % (k + 1)] = wave
+
+    return df
+
+def _levels_wave(phase, levels, delay, period, edge_time, vdd):
+    # Wave of one level per cycle, each change at cycle start plus delay
+        # (in cycles) with logistic edge
+    k = np.clip(np.floor(phase - delay + 0.5).astype(int), 1, len(levels) - 1)
+    tau = edge_time / (2 * LN4)
+    step = expit((phase - delay - k) * period / tau)
+
+    return vdd * (levels[k - 1] + (levels[k] - levels[k - 1]) * step)
+
+def flip_flop(samples=10**4, cycles=None, period=1e-9, clk_to_q=30e-12,
+                edge_time=EDGE_TIME, noise=0, adaptive=0, vdd=VDD, seed=None):
+    """
+        Function to make waveforms of rising edge JK flip-flop with random J
+            and K inputs, in same layout as JK simulation CSVs. J and K
+            change on falling clock edges, Q and QB :clk_to_q: after rising
+            clock edges
+
+        INPUTS
+        :samples: - number of time points
+        :cycles: - number of clock periods, samples/1000 (at least 2) if not
+            given
+        :period: - clock period (s)
+        :clk_to_q: - delay from 50% of rising clock to 50% of Q (s)
+        :edge_time, noise, adaptive, vdd, seed: - see ring_oscillator
+
+        OUTPUT
+        :df: - pd.DataFrame with TIME_COL, 'CLK (V)', 'J (V)', 'K (V)',
+            'Q (V)' and 'QB (V)' columns
+    """
+    rng = np.random.default_rng(seed)
+    if cycles is None:
+        cycles = max(2, samples // 1000)
+    time = sample_times(cycles * period, samples, adaptive, seed)
+    phase = time / period
+
+    # One input level per cycle, first cycle is reset so Q starts known
+    j = rng.integers(0, 2, cycles + 2)
+    k = rng.integers(0, 2, cycles + 2)
+    j[0], k[0] = 0, 1
+    q = pdt.jk_outputs(j, k)
+
+    df = pd.DataFrame({TIME_COL: time})
+    df['CLK (V)'] = _square(phase, period, edge_time, vdd)
+    df['J (V)'] = _levels_wave(phase, j, -0.5, period, edge_time, vdd)
+    df['K (V)'] = _levels_wave(phase, k, -0.5, period, edge_time, vdd)
+    df['Q (V)'] = _levels_wave(phase, q, clk_to_q / period, period, edge_time, vdd)
+    df['QB (V)'] = _levels_wave(phase, 1 - q, clk_to_q / period, period,
+                                edge_time, vdd)
+    if noise:
+        for col in list(df)[1:]:
+            df[col] += rng.normal(0, noise, samples)
+
+    return df
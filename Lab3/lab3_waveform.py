@@ -0,0 +1,131 @@
+import numpy as np
+import lab3_cache as lc
+
+# Time column name, largest rounding error (V) int16 storage may add, working
+    # memory (bytes) analysis of one net may use and bytes of working arrays
+    # needed per point of trace banded at once
+TIME_COL = 'time (s)'
+PRECISION = 1e-3
+MEMORY_BUDGET = 1 << 28
+WORK_BYTES = 32
+INT16_MAX = 32767
+
+class Waveforms:
+    """
+        Compact store of simulation traces. Every net is kept in one 2-D
+            array as float32, or as int16 with per net scale and offset when
+            that rounds values by no more than PRECISION. Time is kept once
+            as float64 and shared by all nets, nothing is copied per net
+
+        USE
+        wf = Waveforms.load('data/oscillator-3.csv')
+        records = la.riseFall_times(wf)
+        wf.values('net1 (V)')
+    """
+    def __init__(self, time, nets, data, scale=None, offset=None):
+        self.time = time
+        self.nets = list(nets)
+        self.data = data
+        self.scale = np.ones(len(nets)) if scale is None else np.asarray(scale)
+        self.offset = np.zeros(len(nets)) if offset is None else np.asarray(offset)
+        self._rows = {net: i for i, net in enumerate(self.nets)}
+
+    @classmethod
+    def from_columns(cls, columns, dtype='auto', time_col=TIME_COL,
+                        precision=PRECISION, budget=MEMORY_BUDGET):
+        """
+            Function to pack columns into Waveforms
+
+            INPUTS
+            :columns: - dict of column name to np.array, such as from
+                lab3_cache.load_columns, including :time_col:
+            :dtype: - 'float32', 'int16' or 'auto' for int16 when every net
+                fits within :precision: and float32 otherwise
+            :precision: - largest rounding error int16 storage may add
+            :budget: - bytes of float64 working arrays used while packing,
+                columns are converted this many bytes at a time
+        """
+        time = np.asarray(columns[time_col])
+        nets = [col for col in columns if col != time_col]
+        lo = np.array([np.min(columns[net]) for net in nets])
+        hi = np.array([np.max(columns[net]) for net in nets])
+        scale = np.where(hi > lo, (hi - lo) / (2 * INT16_MAX), 1.0)
+        offset = (hi + lo) / 2
+
+        if dtype == 'auto':
+            fits = np.all(np.isfinite(lo) & np.isfinite(hi)) and \
+                    np.all(scale / 2 <= precision)
+            dtype = 'int16' if fits else 'float32'
+        if dtype == 'float32':
+            scale, offset = None, None
+        elif dtype == 'int16':
+            if not np.all(np.isfinite(lo) & np.isfinite(hi)):
+                raise ValueError('int16 storage needs every value to be finite')
+        else:
+            raise ValueError("dtype must be 'float32', 'int16' or 'auto', not %s" % dtype)
+
+        data = np.empty((len(nets), len(time)), dtype=dtype)
+        step = max(budget // 8, 1)
+        for i, net in enumerate(nets):
+            for start in range(0, len(time), step):
+                chunk = np.asarray(columns[net][start:start + step], dtype=float)
+                if scale is not None:
+                    chunk = np.rint((chunk - offset[i]) / scale[i])
+                data[i, start:start + step] = chunk
+
+        return cls(time, nets, data, scale, offset)
+
+    @classmethod
+    def from_frame(cls, df, **kwargs):
+        """
+            Function to pack pd.DataFrame of simulation into Waveforms, see
+                from_columns for kwargs
+        """
+        return cls.from_columns({col: df[col].values for col in df}, **kwargs)
+
+    @classmethod
+    def load(cls, filename, **kwargs):
+        """
+            Function to pack CSV into Waveforms straight from its memory-mapped
+                column cache, without making a DataFrame
+        """
+        return cls.from_columns(lc.load_columns(filename), **kwargs)
+
+    def __len__(self):
+        return len(self.time)
+
+    def __iter__(self):
+        return iter(self.nets)
+
+    @property
+    def nbytes(self):
+        return self.time.nbytes + self.data.nbytes
+
+    def codes(self, net):
+        # Stored values of net, view into data
+        return self.data[self._rows[net]]
+
+    def coding(self, net):
+        # (scale, offset) turning stored values of net into voltages
+        i = self._rows[net]
+        return self.scale[i], self.offset[i]
+
+    def values(self, net, start=0, stop=None):
+        """
+            Function to get voltages of net, a view for float32 storage and
+                decoded copy of only the points asked for with int16
+        """
+        i = self._rows[net]
+        codes = self.data[i, start:stop]
+        if self.data.dtype == np.float32:
+            return codes
+
+        return codes * self.scale[i] + self.offset[i]
+
+    def max(self, net):
+        i = self._rows[net]
+        return float(self.data[i].max()) * self.scale[i] + self.offset[i]
+
+def block_size(budget=MEMORY_BUDGET):
+    # Points of trace that can be banded at once within :budget: bytes
+    return max(int(budget) // WORK_BYTES, 2)
@@ -0,0 +1,275 @@
+"""
+    Command line entry point for Lab 3 and J-K flip-flop analysis scripts.
+        Only argparse is loaded up front, each subcommand imports what it
+        needs when it runs
+
+    USE
+    python3 vlsi.py analyze Lab3/data/oscillator-3.csv --netlist Lab3/data/netlist.txt
+    python3 vlsi.py analyze Lab3/data --processes 4
+    python3 vlsi.py sweep Lab3/data/oscillator-3.csv --levels 0.1 0.2 0.5 0.8 0.9
+    python3 vlsi.py plot Final_JKFlipFlop/data/run.csv
+    python3 vlsi.py delay Final_JKFlipFlop/data --check
+    python3 vlsi.py sizing --accelerate
+"""
+import argparse, os, sys
+
+# Script folders, put on import path when a subcommand runs
+ROOT = os.path.dirname(os.path.abspath(__file__))
+LAB3_DIR = os.path.join(ROOT, 'Lab3')
+JK_DIR = os.path.join(ROOT, 'Final_JKFlipFlop')
+
+# Analyze options only used for single files, as (option, args name)
+DIR_IGNORED = (('--json', 'json'), ('--plot', 'plot'), ('--all-plots', 'all_plots'),
+                ('--print', 'print'), ('--dtype', 'dtype'), ('--profile', 'profile'),
+                ('--memory-budget', 'memory_budget'))
+
+def _add_paths():
+    for folder in (JK_DIR, LAB3_DIR):
+        if folder not in sys.path:
+            sys.path.insert(0, folder)
+
+def _profiler(args):
+    # Profiler when --profile is given, None otherwise
+    if not args.profile:
+        return None
+    import lab3_profile as lpf
+    return lpf.Profiler()
+
+def _save_profile(profiler, args):
+    if profiler:
+        print(profiler.totals())
+        profiler.save(args.profile)
+
+def _trigger_params(args):
+    # Trigger settings from --top, --bot, --half, --hysteresis and
+        # --min-dwell, lab3_analysis constants for any not given
+    import lab3_analysis as la
+    params = la.trigger_params()
+    for option in ('top', 'bot', 'half'):
+        if getattr(args, option) is not None:
+            params['%s_trigger' % option] = getattr(args, option)
+    for option in ('hysteresis', 'min_dwell'):
+        if getattr(args, option) is not None:
+            params[option] = getattr(args, option)
+
+    return params
+
+def _add_trigger_options(p):
+    p.add_argument('--top', type=float, help='top trigger fraction (default 0.8)')
+    p.add_argument('--bot', type=float, help='bottom trigger fraction (default 0.2)')
+    p.add_argument('--half', type=float, help='half trigger fraction (default 0.5)')
+    p.add_argument('--hysteresis', type=float, help='hysteresis band fraction')
+    p.add_argument('--min-dwell', type=float, help='shortest edge spacing (s)')
+
+def analyze(args):
+    """
+        Subcommand to find rise, fall and propagation times of oscillator
+            runs. Files are analyzed with lab3_analysis.riseFall_times and
+            directories with lab3_batch.refresh_dir
+    """
+    import lab3_analysis as la
+    # Trigger settings are handed to analysis, and through it to worker
+        # processes, rather than set on lab3_analysis
+    params = _trigger_params(args)
+
+    targets = args.paths or [os.path.join(LAB3_DIR, la.OSC_DATA)]
+    if args.json and len(targets) > 1:
+        args.error('--json can only be used with one file')
+    if any(os.path.isdir(target) for target in targets):
+        used = [name for name, option in DIR_IGNORED if getattr(args, option) != 
+                args.defaults[option]]
+        if used:
+            args.error('%s cannot be used with directories' % ', '.join(used))
+    profiler = _profiler(args)
+
+    for target in targets:
+        if os.path.isdir(target):
+            import lab3_batch as lb
+            all_records, analyzed = lb.refresh_dir(target, processes=args.processes,
+                                        input_col=args.input_col, ext=args.ext,
+                                        netlist=args.netlist, inv_eval=args.inv,
+                                        params=params)
+            for f in all_records:
+                print('%s: %s nets %s' % (f, len(all_records[f]),
+                                    'analyzed' if f in analyzed else 'from cache'))
+            continue
+
+        if args.dtype == 'float64':
+            import lab3_cache as lc
+            data = lc.read_csv_cached(target)
+        else:
+            import lab3_waveform as lw
+            data = lw.Waveforms.load(target, dtype=args.dtype)
+        records = la.riseFall_times(data, showPlot=args.plot, saveJson=args.json or False,
+                                    skipPlots=not args.all_plots, inv_eval=args.inv,
+                                    netlist=args.netlist, profiler=profiler,
+                                    memory_budget=args.memory_budget,
+                                    input_col=args.input_col, params=params)
+        if args.print:
+            la.print_times(records)
+        nets = [net for net in records if net != 'all_invs']
+        print('%s: %s nets analyzed' % (target, len(nets)))
+        for metric, value in records.get('all_invs', {}).items():
+            print('    %s: %.4g ps' % (metric, value / 1e-12))
+
+    _save_profile(profiler, args)
+
+def sweep(args):
+    """
+        Subcommand to find crossing, transition and propagation times of
+            every net at every threshold level with lab3_sweep.characterize
+    """
+    import lab3_analysis as la
+    import lab3_sweep as lsw
+    target = args.file or os.path.join(LAB3_DIR, la.OSC_DATA)
+    if args.dtype == 'float64':
+        import lab3_cache as lc
+        data = lc.read_csv_cached(target)
+    else:
+        import lab3_waveform as lw
+        data = lw.Waveforms.load(target, dtype=args.dtype)
+    table = lsw.characterize(data, args.levels or lsw.LEVELS, inv_eval=args.inv,
+                                netlist=args.netlist, input_col=args.input_col,
+                                memory_budget=args.memory_budget,
+                                params=_trigger_params(args))
+    if args.out:
+        table.to_csv(args.out)
+    print(table['mean'].unstack('metric').to_string())
+
+def plot(args):
+    """
+        Subcommand to plot flip-flop run for picking delays with mouse clicks
+    """
+    import plotdata
+    profiler = _profiler(args)
+    filename = args.file or plotdata.get_files(os.path.join(JK_DIR, plotdata.DATA_DIR))
+    plotdata.plot_file(filename, dt=args.dt, profiler=profiler)
+    _save_profile(profiler, args)
+
+def delay(args):
+    """
+        Subcommand to get clock to output delays of every flip-flop run in
+            directory, or to check runs against JK truth table
+    """
+    import plotdata
+    data_dir = args.dir or os.path.join(JK_DIR, plotdata.DATA_DIR)
+    if args.check:
+        plotdata.jk_check_dir(data_dir, args.ext)
+        return
+    delays = plotdata.clk_q_dir(data_dir, args.ext, cached=not args.no_cache,
+                                clk_col=args.clk_col, clk_edge=args.clk_edge)
+    print(plotdata.delay_summary(delays).to_string())
+
+def sizing(args):
+    """
+        Subcommand to size JK flip-flop path with logical effort until C_in
+            values converge
+    """
+    import numpy as np
+    import cinCalcs as cc
+    cin = args.cin or cc.CIN_START
+    g = args.g or cc.JK_PATH['g']
+    if len(cin) != len(g) or len(g) != len(cc.JK_PATH['g']):
+        args.error('--cin and --g need one value for each of the %s path stages' %
+                    len(cc.JK_PATH['g']))
+    C, iters, converged, hist = cc.solve_sizing(cin, g,
+                                        tol=cc.TOL if args.tol is None else args.tol,
+                                        max_iter=cc.MAX_ITER if args.max_iter is None
+                                                    else args.max_iter,
+                                        accelerate=args.accelerate, history=True)
+    G, H, B, F, b, f = cc.get_params(C[0], g)
+    print('%s after %s iterations' % ('CONVERGED' if converged[0] else
+                                        'NOT CONVERGED', iters[0]))
+    print('C_in values:', cc.round_list(list(C[0])))
+    print('G=%.4g H=%.4g B=%.4g F=%.4g f=%.4g' % (G, H, B, F, f))
+    print('b values by stage:', b)
+    print('Delay (tau): %.4g' % cc.path_delay(C[0], g))
+
+    if args.plot:
+        import matplotlib.pyplot as plt
+        plt.plot(np.array(hist)[1:, 0])
+        plt.legend(['STAGE %s' % (i + 1) for i in range(len(cin))])
+        plt.xlabel('Iteration')
+        plt.ylabel('C_in Value')
+        plt.title('C_in Value Stabilization')
+        plt.show()
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='VLSI lab analysis tools')
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+
+    p = sub.add_parser('analyze', help='rise, fall and propagation times of '
+                        'oscillator runs')
+    p.add_argument('paths', nargs='*', help='CSV or raw files, or directories to '
+                    'analyze every file of (only new or changed files are analyzed). '
+                    'Lab3 oscillator-3.csv if not given')
+    p.add_argument('--netlist', help='netlist to order nets and get stage delays with')
+    p.add_argument('--input-col', help='net propagation times are referenced to')
+    _add_trigger_options(p)
+    p.add_argument('--inv', action='store_true', help='single inverter run')
+    p.add_argument('--json', help='file to save records to')
+    p.add_argument('--plot', action='store_true', help='show traces and edges')
+    p.add_argument('--all-plots', action='store_true', help='plot every net')
+    p.add_argument('--print', action='store_true', help='print every time found')
+    p.add_argument('--dtype', default='float64', choices=['float64', 'float32',
+                    'int16', 'auto'], help='storage of waveforms while analyzing')
+    p.add_argument('--memory-budget', type=float, help='bytes of working arrays')
+    p.add_argument('--processes', type=int, help='worker processes for directories')
+    p.add_argument('--ext', default='.csv', help='file extension in directories')
+    p.add_argument('--profile', help='file to save stage profile to (.json or .csv)')
+    p.set_defaults(func=analyze, error=p.error,
+                    defaults={option: p.get_default(option) for _, option in DIR_IGNORED})
+
+    p = sub.add_parser('sweep', help='crossing, transition and propagation times '
+                        'at many threshold levels')
+    p.add_argument('file', nargs='?', help='CSV or raw file, Lab3 oscillator-3.csv '
+                    'if not given')
+    p.add_argument('--levels', type=float, nargs='+', help='threshold fractions of '
+                    'max value (default 0.1 to 0.9 in steps of 0.1)')
+    p.add_argument('--netlist', help='netlist to get stage delays with')
+    p.add_argument('--input-col', help='net propagation times are referenced to')
+    _add_trigger_options(p)
+    p.add_argument('--inv', action='store_true', help='single inverter run')
+    p.add_argument('--dtype', default='float64', choices=['float64', 'float32',
+                    'int16', 'auto'], help='storage of waveforms while analyzing')
+    p.add_argument('--memory-budget', type=float, help='bytes of working arrays')
+    p.add_argument('--out', help='CSV to save level, net and metric table to')
+    p.set_defaults(func=sweep)
+
+    p = sub.add_parser('plot', help='plot flip-flop run and pick delays by clicking')
+    p.add_argument('file', nargs='?', help='CSV to plot, asked for if not given')
+    p.add_argument('--dt', type=float, help='time step (s) run is resampled to')
+    p.add_argument('--profile', help='file to save stage profile to (.json or .csv)')
+    p.set_defaults(func=plot)
+
+    p = sub.add_parser('delay', help='clock to output delays of flip-flop runs')
+    p.add_argument('dir', nargs='?', help='directory of runs, Final_JKFlipFlop/data '
+                    'if not given')
+    p.add_argument('--ext', default='.csv', help='file extension of runs')
+    p.add_argument('--clk-col', default='CLK (V)')
+    p.add_argument('--clk-edge', default='rise', choices=['rise', 'fall'])
+    p.add_argument('--no-cache', action='store_true', help='find every delay again')
+    p.add_argument('--check', action='store_true', help='check runs against JK '
+                    'truth table instead')
+    p.set_defaults(func=delay)
+
+    p = sub.add_parser('sizing', help='logical effort sizing of JK flip-flop path')
+    p.add_argument('--cin', type=float, nargs='+', help='starting C_in of each stage')
+    p.add_argument('--g', type=float, nargs='+', help='logical effort of each stage')
+    p.add_argument('--tol', type=float, help='largest relative change to converge')
+    p.add_argument('--max-iter', type=int)
+    p.add_argument('--accelerate', action='store_true',
+                    help='Anderson mixing of last sizing steps, fewer steps to converge')
+    p.add_argument('--plot', action='store_true', help='plot C_in by iteration')
+    p.set_defaults(func=sizing, error=p.error)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    _add_paths()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()